@@ -0,0 +1,536 @@
+import argparse
+import csv
+import logging
+import re
+import sys
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from KicadModTree import Model
+
+from helper.component import LCComponent
+from helper.footprint import FootprintManager
+from helper.footprint.model3d import DOWNLOAD_WORKERS
+from helper.network import configure_cache, configure_session
+from helper.network import ResponseCache
+from helper.network import fetch_product_detail
+from helper.schematic import SchematicManager, SchematicExist
+
+
+logger = logging.getLogger("KICONV")
+
+
+LCID_RE = re.compile(r"^C\d+$", re.I)
+LCID_HEADER_RE = re.compile(r"lcsc|lcid|supplier part|jlc", re.I)
+
+ON_EXIST_SKIP = 'skip'
+ON_EXIST_OVERWRITE = 'overwrite'
+
+
+class PartResult:
+
+    def __init__(self, lcid):
+        self.lcid = lcid
+        self.ok = False
+        self.message = ""
+        self.symbol_name = ""
+        self.footprint_name = ""
+        self.model3d_name = ""
+        self.symbol_data = None
+        self.footprint_data = None
+        # status per item: added / updated / reused / skipped / missing /
+        # failed / -
+        # a symbol is pending until the batch is committed.
+        self.status = {'symbol': '-', 'footprint': '-', '3d': '-'}
+
+    @property
+    def state(self):
+        if not self.ok:
+            return "FAILED"
+
+        if all(x in ('skipped', 'missing', '-') for x in self.status.values()):
+            return "SKIPPED"
+
+        return "OK"
+
+
+def read_bom(path):
+    """
+    Read LCIDs from a CSV/TSV BOM.
+
+    The LCSC column is found by its header (LCSC, LCID, Supplier Part,
+    JLCPCB Part...), without a matching header every cell that looks like
+    a LCID is taken.
+    """
+    text = Path(path).read_text(encoding='utf-8-sig')
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",\t;")
+    except csv.Error:
+        dialect = csv.excel_tab if "\t" in text else csv.excel
+
+    rows = list(csv.reader(text.splitlines(), dialect))
+    if not rows:
+        return []
+
+    columns = [i for i, x in enumerate(rows[0]) if LCID_HEADER_RE.search(x)]
+    if columns:
+        rows = rows[1:]
+
+    lcids = []
+    for row in rows:
+        cells = [row[i] for i in columns if i < len(row)] if columns else row
+        for cell in cells:
+            cell = cell.strip()
+            if LCID_RE.match(cell):
+                lcids.append(cell.upper())
+
+    return lcids
+
+
+def collect_lcids(sources):
+    lcids = []
+    for src in sources:
+        if LCID_RE.match(src):
+            lcids.append(src.upper())
+        elif Path(src).is_file():
+            lcids.extend(read_bom(src))
+        else:
+            logger.error("Not a LCID or BOM file: %s", src)
+
+    # keep BOM order, drop duplicated lines.
+    return list(dict.fromkeys(lcids))
+
+
+def fetch_lc_data(lcid):
+    # LCSC detail (datasheet, category, description), same as the GUI. the
+    # part is still converted without it.
+    try:
+        return fetch_product_detail(lcid).get('result') or None
+    except Exception as e:
+        logger.warning("Fetch %s detail failed. %s", lcid, e)
+        return None
+
+
+def convert_part(
+    lcid,
+    scale=10,
+    with_symbol=True,
+    with_footprint=True,
+    merge_tracks=True,
+    with_3d=True
+):
+    """
+    Fetch and convert one part. Runs in the worker pool (thread or process),
+    nothing is written to the library here.
+    """
+    result = PartResult(lcid)
+
+    try:
+        component = LCComponent(lcid, fetch_lc_data(lcid))
+        if not component.load_componnt():
+            result.message = "Unable to load component."
+            return result
+
+        result.symbol_name = component.symbol_name
+        result.footprint_name = component.footprint_name
+        result.model3d_name = component.model3d_name
+
+        if with_symbol:
+            result.symbol_data = component.gen_symbol_data(
+                result.symbol_name, result.footprint_name, scale
+            )
+
+        if with_footprint:
+            result.footprint_data = component.gen_footprint_data(
+                result.footprint_name, merge_tracks, with_3d
+            )
+            if result.footprint_data is None:
+                # the symbol is still written.
+                result.status['footprint'] = 'missing'
+                result.message = "No footprint."
+            elif result.footprint_data.c_3d_model is not None:
+                # let the background download land in the cache before the
+                # part is handed over, the writer then reads it from disk.
+                result.footprint_data.c_3d_model.wait()
+    except Exception as e:
+        logger.exception("Convert %s failed.", lcid)
+        result.message = f"{e.__class__.__name__}: {e}"
+        return result
+
+    result.ok = True
+    return result
+
+
+class BatchExporter:
+    """
+    Write converted parts into the library. Only called from the main
+    thread, so the library files have a single writer.
+
+    Symbols are buffered in a SchematicBatch and written by commit(), their
+    status is set once the commit is done.
+    """
+
+    def __init__(
+        self,
+        lib_root,
+        lib_name,
+        lib_prefix='libs',
+        on_exist=ON_EXIST_SKIP,
+        with_3d=True,
+        derive_symbols=True
+    ):
+        self.on_exist = on_exist
+        self.with_3d = with_3d
+        self.schematic_manager = SchematicManager(
+            lib_root, lib_name, derive=derive_symbols
+        )
+        self.schematic_manager.build_schematic_db()
+        self.symbols = self.schematic_manager.batch()
+        # (result, status) of the symbols in the batch.
+        self.pending = []
+        self.footprint_manager = FootprintManager(
+            lib_root, lib_name, lib_prefix
+        )
+
+    @property
+    def overwrite(self):
+        return self.on_exist == ON_EXIST_OVERWRITE
+
+    def write_symbol(self, result):
+        if result.symbol_data is None:
+            return
+
+        try:
+            self.symbols.add(result.symbol_name, result.symbol_data)
+            status = 'added'
+        except SchematicExist:
+            if not self.overwrite:
+                result.status['symbol'] = 'skipped'
+                return
+            self.symbols.add(
+                result.symbol_name, result.symbol_data, update=True
+            )
+            status = 'updated'
+
+        result.status['symbol'] = 'pending'
+        self.pending.append((result, status))
+
+    def write_footprint(self, result):
+        footprint_data = result.footprint_data
+        if footprint_data is None:
+            return
+
+        name = result.footprint_name
+        exist = self.footprint_manager.check_footprint(name)
+        if exist and not self.overwrite:
+            result.status['footprint'] = 'skipped'
+            return
+
+        model3d_data = footprint_data.c_3d_model
+        model3d_name = result.model3d_name
+        if self.with_3d and model3d_data and model3d_name:
+            stored = self.footprint_manager.find_3d_model(model3d_data)
+            model_exist = self.footprint_manager.check_3d_model(model3d_name)
+            if stored is not None:
+                model3d_name = stored
+                result.status['3d'] = 'reused'
+            elif model_exist and not self.overwrite:
+                result.status['3d'] = 'skipped'
+            else:
+                stored = self.footprint_manager.add_3d_model(
+                    model3d_name, model3d_data, True
+                )
+                if stored != model3d_name:
+                    model3d_name = stored
+                    result.status['3d'] = 'reused'
+                else:
+                    result.status['3d'] = 'updated' if model_exist else 'added'
+
+            model_path = self.footprint_manager.get_3d_model_ref_path(
+                model3d_name
+            )
+            footprint_data.append(
+                Model(
+                    filename=model_path,
+                    rotate=footprint_data.c_3d_model_rotation
+                )
+            )
+
+        self.footprint_manager.add_footprint(name, footprint_data, update=True)
+        result.status['footprint'] = 'updated' if exist else 'added'
+
+    def write(self, result):
+        if not result.ok:
+            return
+
+        try:
+            self.write_symbol(result)
+            self.write_footprint(result)
+        except Exception as e:
+            logger.exception("Write %s failed.", result.lcid)
+            result.ok = False
+            result.message = f"{e.__class__.__name__}: {e}"
+
+    def commit(self):
+        """
+        Write the batched symbols. On failure every batched part is marked
+        as failed, returns False.
+        """
+        pending, self.pending = self.pending, []
+
+        try:
+            self.symbols.commit()
+        except Exception as e:
+            logger.exception("Write symbols failed.")
+            for result, _ in pending:
+                result.ok = False
+                result.status['symbol'] = 'failed'
+                result.message = f"Symbol: {e.__class__.__name__}: {e}"
+            return False
+
+        for result, status in pending:
+            result.status['symbol'] = status
+
+        return True
+
+
+def print_summary(results, fp=sys.stdout):
+    row = "{:<12} {:<8} {:<9} {:<9} {:<9} {}"
+    fp.write(row.format("LCID", "STATE", "SYMBOL", "FOOTPRINT", "3D", "NOTE"))
+    fp.write("\n")
+    for result in results:
+        note = result.message or result.symbol_name or result.footprint_name
+        fp.write(row.format(
+            result.lcid,
+            result.state,
+            result.status['symbol'],
+            result.status['footprint'],
+            result.status['3d'],
+            note
+        ))
+        fp.write("\n")
+
+    states = [x.state for x in results]
+    fp.write(
+        f"\nTotal: {len(results)}, OK: {states.count('OK')}, "
+        f"Skipped: {states.count('SKIPPED')}, Failed: {states.count('FAILED')}\n"
+    )
+
+
+def load_lib_name(lib_root):
+    # same file the export dialog uses.
+    conf = Path(lib_root).joinpath(".KLPM.conf")
+    if conf.is_file():
+        name = conf.read_text().strip()
+        if name:
+            return name
+
+    return 'lcsc'
+
+
+def setup_network(pool_size, cache_dir=None, use_cache=True):
+    # also the process pool initializer, a worker process gets the same
+    # session / cache settings.
+    configure_session(pool_size=pool_size)
+    configure_cache(cache_dir, use_cache)
+
+
+def cmd_import(args):
+    lcids = collect_lcids(args.sources)
+    if not lcids:
+        logger.error("No LCID found.")
+        return 1
+
+    lib_name = args.lib_name or load_lib_name(args.lib_path)
+    logger.info(
+        "Import %s parts into %s (%s), %s workers.",
+        len(lcids),
+        args.lib_path,
+        lib_name,
+        args.jobs
+    )
+
+    exporter = BatchExporter(
+        args.lib_path,
+        lib_name,
+        lib_prefix=args.lib_prefix,
+        on_exist=args.on_exist,
+        with_3d=not args.no_3d,
+        derive_symbols=not args.no_derive
+    )
+
+    # one pooled connection per worker and background model download.
+    network = (args.jobs + DOWNLOAD_WORKERS, args.cache_dir, not args.no_cache)
+    setup_network(*network)
+
+    if args.processes:
+        pool = ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=setup_network,
+            initargs=network
+        )
+    else:
+        pool = ThreadPoolExecutor(max_workers=args.jobs)
+
+    results = {}
+    with pool:
+        futures = {
+            pool.submit(
+                convert_part,
+                lcid,
+                args.scale,
+                not args.no_symbol,
+                not args.no_footprint,
+                not args.no_merge_tracks,
+                not args.no_3d
+            ): lcid
+            for lcid in lcids
+        }
+        for future in as_completed(futures):
+            lcid = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = PartResult(lcid)
+                result.message = f"{e.__class__.__name__}: {e}"
+
+            exporter.write(result)
+            results[lcid] = result
+            logger.info("[%s/%s] %s %s", len(results), len(lcids), lcid, result.state)
+
+    exporter.commit()
+    ordered = [results[x] for x in lcids]
+    print_summary(ordered)
+
+    return 0 if all(x.ok for x in ordered) else 2
+
+
+def cmd_dedup_models(args):
+    lib_name = args.lib_name or load_lib_name(args.lib_path)
+    manager = FootprintManager(args.lib_path, lib_name, args.lib_prefix)
+
+    duplicates, rewritten = manager.dedup_3d_models(dry_run=args.dry_run)
+
+    for kept, removed in duplicates.items():
+        print(f"{kept}: {', '.join(removed)}")
+    for name in rewritten:
+        print(f"footprint: {name}")
+
+    removed = sum(len(x) for x in duplicates.values())
+    action = "to remove" if args.dry_run else "removed"
+    print(
+        f"\n{removed} duplicated models {action}, "
+        f"{len(rewritten)} footprints {'to update' if args.dry_run else 'updated'}."
+    )
+    return 0
+
+
+def cmd_cache(args):
+    cache = ResponseCache(args.cache_dir)
+
+    if args.action == 'clear':
+        cache.clear()
+        print(f"{cache.root} cleared.")
+        return 0
+
+    max_size = args.max_size * 1024 * 1024 if args.max_size else None
+    removed, freed = cache.prune(max_size)
+    print(
+        f"{cache.root}: {removed} files removed, "
+        f"{freed / 1024 / 1024:.1f} MB freed."
+    )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="KiCAD LCSC Part Manager, headless tools."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('import', help="import parts from BOM files / LCIDs")
+    p.add_argument(
+        'sources', nargs='+',
+        help="CSV/TSV BOM files or LCIDs (C2040 ...)"
+    )
+    p.add_argument('-l', '--lib-path', required=True, help="library directory")
+    p.add_argument('-n', '--lib-name', help="library name (default: .KLPM.conf or lcsc)")
+    p.add_argument('--lib-prefix', default='libs', help="3D model path prefix")
+    p.add_argument('-j', '--jobs', type=int, default=8, help="concurrent workers")
+    p.add_argument(
+        '--processes', action='store_true',
+        help="convert in a process pool instead of threads"
+    )
+    p.add_argument(
+        '--on-exist', choices=[ON_EXIST_SKIP, ON_EXIST_OVERWRITE],
+        default=ON_EXIST_SKIP,
+        help="what to do with parts already in the library"
+    )
+    p.add_argument('--scale', type=int, default=10, help="symbol scale")
+    p.add_argument('--no-symbol', action='store_true')
+    p.add_argument('--no-footprint', action='store_true')
+    p.add_argument('--no-3d', action='store_true')
+    p.add_argument(
+        '--no-merge-tracks', action='store_true',
+        help="keep every track segment as is, no polyline merging"
+    )
+    p.add_argument(
+        '--no-derive', action='store_true',
+        help="write every symbol in full, no (extends ...) for identical drawings"
+    )
+    p.add_argument(
+        '--no-cache', action='store_true',
+        help="always fetch from EasyEDA / LCSC, the response cache is not used"
+    )
+    p.add_argument(
+        '--cache-dir', type=Path,
+        help="response cache directory (default: user cache dir or KLPM_CACHE_DIR)"
+    )
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser(
+        'dedup-models',
+        help="merge identical 3D models of a library, update the footprints"
+    )
+    p.add_argument('-l', '--lib-path', required=True, help="library directory")
+    p.add_argument('-n', '--lib-name', help="library name (default: .KLPM.conf or lcsc)")
+    p.add_argument('--lib-prefix', default='libs', help="3D model path prefix")
+    p.add_argument(
+        '--dry-run', action='store_true',
+        help="only print what would be changed"
+    )
+    p.set_defaults(func=cmd_dedup_models)
+
+    p = sub.add_parser('cache', help="prune or clear the response cache")
+    p.add_argument('action', choices=['prune', 'clear'])
+    p.add_argument(
+        '--cache-dir', type=Path,
+        help="response cache directory (default: user cache dir or KLPM_CACHE_DIR)"
+    )
+    p.add_argument(
+        '--max-size', type=int,
+        help="prune: size limit in MB (default: 1024)"
+    )
+    p.set_defaults(func=cmd_cache)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        datefmt='%H:%M:%S'
+    )
+
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,237 @@
 import wx
 import wx.dataview
 
+import json
 import logging
-import requests
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from helper.network import http_post
 
 
 logger = logging.getLogger("ADVSEARCH")
 
 
+SEARCH_API = "https://easyeda.com/api/components/search"
+
+# ms without typing before the search starts.
+SEARCH_DEBOUNCE = 300
+SEARCH_MIN_LENGTH = 2
+
+# seconds a query result is reused.
+SEARCH_CACHE_TTL = 5 * 60
+SEARCH_CACHE_SIZE = 64
+
+RESPONSE_CHUNK_SIZE = 16 * 1024
+
+# (title, width) of the result columns.
+RESULT_COLUMNS = (
+    ("LCID", 80),
+    ("Part No.", 100),
+    ("Manufacturer", 100),
+    ("SMT", 50),
+    ("Footprint", 150),
+    ("Description", 200),
+)
+COL_SMT = 3
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def record_row(record):
+    c_para = record['dataStr']['head']['c_para']
+    return [
+        c_para['Supplier Part'],
+        c_para['name'],
+        c_para.get('Manufacturer', ""),
+        record.get('SMT', False),
+        c_para['package'],
+        record['description'] or record.get('tags', [""])[0]
+    ]
+
+
+def lcid_key(value):
+    # C2040 before C25804.
+    if value[1:].isdigit():
+        return (0, int(value[1:]), value)
+    return (1, 0, value)
+
+
+def text_key(value):
+    return value.lower()
+
+
+SORT_KEYS = (lcid_key, text_key, text_key, bool, text_key, text_key)
+
+
+class ResultStore:
+    """
+    Search results stored column by column. The rows shown are a view
+    (array of row indexes), filtering and sorting only rebuild the view.
+    """
+
+    def __init__(self, columns=None, text=None):
+        if columns is None:
+            columns = tuple(() for _ in RESULT_COLUMNS)
+
+        self.columns = columns
+        self.size = len(columns[0])
+        if text is None:
+            text = tuple(
+                " ".join(str(x) for x in row).lower() for row in zip(*columns)
+            )
+        # lower case row text, for the filter.
+        self.text = text
+
+        self.terms = ()
+        self.sort_column = None
+        self.ascending = True
+        self.view = array('l', range(self.size))
+
+    @classmethod
+    def from_records(cls, records):
+        rows = [record_row(x) for x in records]
+        if not rows:
+            return cls()
+
+        return cls(tuple(tuple(x) for x in zip(*rows)))
+
+    def __len__(self):
+        return len(self.view)
+
+    def value(self, row, col):
+        return self.columns[col][self.view[row]]
+
+    def _match(self, terms):
+        text = self.text
+        return [
+            i for i in range(self.size)
+            if all(term in text[i] for term in terms)
+        ]
+
+    def subset(self, query):
+        """A new store with the rows matching every term of `query`."""
+        index = self._match(query.lower().split())
+        return ResultStore(
+            tuple(tuple(col[i] for i in index) for col in self.columns),
+            tuple(self.text[i] for i in index)
+        )
+
+    def set_filter(self, text):
+        self.terms = tuple(text.lower().split())
+        self._update_view()
+
+    def set_sort(self, col, ascending=True):
+        self.sort_column = col
+        self.ascending = ascending
+        self._update_view()
+
+    def _update_view(self):
+        if self.terms:
+            index = self._match(self.terms)
+        else:
+            index = range(self.size)
+
+        if self.sort_column is not None:
+            column = self.columns[self.sort_column]
+            key = SORT_KEYS[self.sort_column]
+            index = sorted(
+                index,
+                key=lambda i: key(column[i]),
+                reverse=not self.ascending
+            )
+
+        self.view = array('l', index)
+
+
+class ResultModel(wx.dataview.DataViewVirtualListModel):
+    """
+    Virtual model of a ResultStore, the control reads the visible rows
+    only.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or ResultStore()
+        wx.dataview.DataViewVirtualListModel.__init__(self, len(self.store))
+
+    def set_store(self, store):
+        self.store = store
+        self.Reset(len(store))
+
+    def refresh(self):
+        self.Reset(len(self.store))
+
+    def GetColumnCount(self):
+        return len(RESULT_COLUMNS)
+
+    def GetColumnType(self, col):
+        return "bool" if col == COL_SMT else "string"
+
+    def GetValueByRow(self, row, col):
+        return self.store.value(row, col)
+
+    def SetValueByRow(self, value, row, col):
+        return False
+
+
+class SearchCache:
+    """
+    Short lived cache of query -> ResultStore. A query that extends a
+    cached one (same prefix) gets the cached results filtered locally while
+    its own request runs.
+    """
+
+    def __init__(self, ttl=SEARCH_CACHE_TTL, size=SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh(self, query):
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+
+        stored_at, store = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[query]
+            return None
+
+        return store
+
+    def get(self, query):
+        with self._lock:
+            return self._fresh(query)
+
+    def put(self, query, store):
+        with self._lock:
+            self._entries[query] = (time.monotonic(), store)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get_prefix(self, query):
+        """
+        Results of the longest cached prefix of `query`, filtered on the
+        terms of `query`. None if there is no cached prefix.
+        """
+        with self._lock:
+            for end in range(len(query) - 1, 0, -1):
+                store = self._fresh(query[:end])
+                if store is not None:
+                    break
+            else:
+                return None
+
+        return store.subset(query)
+
+
 class AdvSearchFrame(wx.Dialog):
     def __init__(self, *args, **kwds):
         # begin wxGlade: MyDialog.__init__
@@ -21,7 +245,9 @@ class AdvSearchFrame(wx.Dialog):
         sizer_2 = wx.BoxSizer(wx.HORIZONTAL)
         sizer_1.Add(sizer_2, 0, wx.EXPAND, 0)
 
-        self.txt_search = wx.TextCtrl(self, wx.ID_ANY, "")
+        self.txt_search = wx.TextCtrl(
+            self, wx.ID_ANY, "", style=wx.TE_PROCESS_ENTER
+        )
         self.txt_search.SetMinSize((200, 25))
         sizer_2.Add(self.txt_search, 0, wx.ALIGN_CENTER_VERTICAL, 0)
 
@@ -37,18 +263,26 @@ class AdvSearchFrame(wx.Dialog):
         sizer_3 = wx.StaticBoxSizer(wx.StaticBox(self, wx.ID_ANY, "Search Results"), wx.VERTICAL)
         sizer_1.Add(sizer_3, 1, wx.EXPAND, 0)
 
-        self.list_search_resutls = wx.dataview.DataViewListCtrl(
+        self.txt_filter = wx.TextCtrl(self, wx.ID_ANY, "")
+        self.txt_filter.SetHint("Filter results")
+        sizer_3.Add(self.txt_filter, 0, wx.EXPAND, 0)
+
+        self.list_search_resutls = wx.dataview.DataViewCtrl(
             self,
             wx.ID_ANY,
             style=wx.dataview.DV_ROW_LINES | wx.dataview.DV_SINGLE | wx.dataview.DV_HORIZ_RULES | wx.dataview.DV_VERT_RULES
         )
-        self.list_search_resutls.AppendTextColumn("LCID", mode=wx.dataview.DATAVIEW_CELL_INERT, width=80)
-        self.list_search_resutls.AppendTextColumn("Part No.", mode=wx.dataview.DATAVIEW_CELL_INERT, width=100)
-        self.list_search_resutls.AppendTextColumn("Manufacturer", mode=wx.dataview.DATAVIEW_CELL_INERT, width=100)
-        # self.list_search_resutls.AppendColumn("SMT", format=wx.LIST_FORMAT_LEFT, width=50)
-        self.list_search_resutls.AppendToggleColumn("SMT", mode=wx.dataview.DATAVIEW_CELL_INERT, width=50)
-        self.list_search_resutls.AppendTextColumn("Footprint", mode=wx.dataview.DATAVIEW_CELL_INERT, width=150)
-        self.list_search_resutls.AppendTextColumn("Description", mode=wx.dataview.DATAVIEW_CELL_INERT, width=200)
+        self.result_model = ResultModel()
+        self.list_search_resutls.AssociateModel(self.result_model)
+        for col, (title, width) in enumerate(RESULT_COLUMNS):
+            if col == COL_SMT:
+                self.list_search_resutls.AppendToggleColumn(
+                    title, col, mode=wx.dataview.DATAVIEW_CELL_INERT, width=width
+                )
+            else:
+                self.list_search_resutls.AppendTextColumn(
+                    title, col, mode=wx.dataview.DATAVIEW_CELL_INERT, width=width
+                )
         sizer_3.Add(self.list_search_resutls, 1, wx.EXPAND, 0)
 
         self.SetSizer(sizer_1)
@@ -66,30 +300,74 @@ class AdvSearchControl:
         self.frame = None
         self.lcsc_part = None
         self.ret_status = None
-        self.last_result =None
+        self.last_result = None
+        self.debounce = None
+        self.cache = SearchCache()
+        # bumped by every search, older searches are superseded.
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="advsearch"
+        )
+
+    def is_current(self, generation):
+        with self._generation_lock:
+            return generation == self.generation
 
-    def request_part_from_eda(self, value):
+    def request_part_from_eda(self, value, generation=None):
+        """
+        Search results (records) of `value`. The response is read in
+        chunks, the request is dropped as soon as a newer search starts
+        (SearchCancelled).
+        """
         payload = {
             'type': 3,
             'doctype[]': 2,
             'returnListStyle': 'classifyarr',
             'wd': value
         }
-        r = requests.post(
-            "https://easyeda.com/api/components/search",
-            data=payload
-        )
-        data = r.json()
+
+        def check():
+            if generation is not None and not self.is_current(generation):
+                raise SearchCancelled()
+
+        check()
+        r = http_post(SEARCH_API, data=payload, stream=True)
+        try:
+            chunks = []
+            for chunk in r.iter_content(RESPONSE_CHUNK_SIZE):
+                check()
+                chunks.append(chunk)
+        finally:
+            r.close()
+
+        data = json.loads(b"".join(chunks))
 
         if data['code'] != 0:
-            wx.MessageBox(
-                f"Error: API code {data['code']}.\n Msg: {data['message']}", 'Error', wx.OK | wx.ICON_ERROR
+            raise RuntimeError(
+                f"Error: API code {data['code']}.\n Msg: {data['message']}"
             )
-            return None
 
         return data['result']['lists']['lcsc']
 
+    def on_text_changed(self, e):
+        # search once the typing stops.
+        if self.debounce is None:
+            self.debounce = wx.CallLater(SEARCH_DEBOUNCE, self.search_typed)
+        else:
+            self.debounce.Start(SEARCH_DEBOUNCE)
+
+    def search_typed(self):
+        value = self.frame.txt_search.GetValue().strip()
+        if len(value) < SEARCH_MIN_LENGTH:
+            return
+
+        self.start_search(value, interactive=False)
+
     def do_part_search(self, e):
+        if self.debounce is not None:
+            self.debounce.Stop()
+
         value = self.frame.txt_search.GetValue().strip()
 
         if value == "":
@@ -98,30 +376,90 @@ class AdvSearchControl:
             )
             return
 
-        self.frame.list_search_resutls.DeleteAllItems()
-        results = self.request_part_from_eda(value)
+        self.start_search(value, interactive=True)
+
+    def on_filter_changed(self, e):
+        store = self.frame.result_model.store
+        store.set_filter(self.frame.txt_filter.GetValue())
+        self.frame.result_model.refresh()
+
+    def on_header_click(self, e):
+        # sort in the store, a second click on the column reverses it.
+        col = e.GetColumn()
+        store = self.frame.result_model.store
+        ascending = not (store.sort_column == col and store.ascending)
+        store.set_sort(col, ascending)
+        self.frame.result_model.refresh()
+
+        for i, (title, _) in enumerate(RESULT_COLUMNS):
+            if i == col:
+                title = f"{title} {'▲' if ascending else '▼'}"
+            self.frame.list_search_resutls.GetColumn(i).SetTitle(title)
+
+    def start_search(self, value, interactive):
+        with self._generation_lock:
+            self.generation += 1
+            generation = self.generation
+
+        store = self.cache.get(value)
+        if store is not None:
+            logger.debug("Adv Search: %s from cache.", value)
+            self.show_results(generation, value, store, interactive)
+            return
+
+        # results of a shorter query first, while this one runs.
+        store = self.cache.get_prefix(value)
+        if store is not None:
+            self.show_store(store)
+
+        self.executor.submit(self.search_part, generation, value, interactive)
+
+    def search_part(self, generation, value, interactive):
+        # superseded before it started, nothing is sent.
+        if not self.is_current(generation):
+            return
+
+        try:
+            results = self.request_part_from_eda(value, generation)
+            store = ResultStore.from_records(results)
+        except SearchCancelled:
+            logger.debug("Adv Search: %s cancelled.", value)
+            return
+        except Exception as e:
+            logger.warning("Adv Search: search %s failed. %s", value, e)
+            if interactive:
+                wx.CallAfter(self.show_error, generation, str(e))
+            return
+
+        self.cache.put(value, store)
+        wx.CallAfter(self.show_results, generation, value, store, interactive)
+
+    def show_error(self, generation, msg):
+        if self.frame is None or not self.is_current(generation):
+            return
 
-        if results is None:
+        wx.MessageBox(msg, 'Error', wx.OK | wx.ICON_ERROR)
+
+    def show_results(self, generation, value, store, interactive):
+        if self.frame is None or not self.is_current(generation):
             return
 
-        if len(results) == 0:
+        if len(store) == 0 and interactive:
+            self.frame.result_model.set_store(ResultStore())
             wx.MessageBox(
                 "No Result.", 'Info', wx.OK | wx.ICON_INFORMATION
             )
             return
 
-        self.last_result = results
-        for record in results:
-            c_para = record['dataStr']['head']['c_para']
-            data = [
-                c_para['Supplier Part'],
-                c_para['name'],
-                c_para.get('Manufacturer', ""),
-                record.get('SMT', False),
-                c_para['package'],
-                record['description'] or record.get('tags', [""])[0]
-            ]
-            self.frame.list_search_resutls.AppendItem(data)
+        self.last_result = store
+        self.show_store(store)
+
+    def show_store(self, store):
+        # keep the filter and sort order of the shown results.
+        current = self.frame.result_model.store
+        store.terms = tuple(self.frame.txt_filter.GetValue().lower().split())
+        store.set_sort(current.sort_column, current.ascending)
+        self.frame.result_model.set_store(store)
 
     def on_item_double_click(self, e):
         item = e.GetItem()
@@ -141,6 +479,13 @@ class AdvSearchControl:
         if self.frame is None:
             self.frame = AdvSearchFrame(self.wx_parent, wx.ID_ANY, "")
             self.frame.btn_search.Bind(wx.EVT_BUTTON, self.do_part_search)
+            self.frame.txt_search.Bind(wx.EVT_TEXT, self.on_text_changed)
+            self.frame.txt_search.Bind(wx.EVT_TEXT_ENTER, self.do_part_search)
+            self.frame.txt_filter.Bind(wx.EVT_TEXT, self.on_filter_changed)
+            self.frame.list_search_resutls.Bind(
+                wx.dataview.EVT_DATAVIEW_COLUMN_HEADER_CLICK,
+                self.on_header_click
+            )
             self.frame.list_search_resutls.Bind(
                 wx.dataview.EVT_DATAVIEW_ITEM_ACTIVATED,
                 self.on_item_double_click
@@ -149,6 +494,12 @@ class AdvSearchControl:
         self.lcsc_part = None
         t = self.frame.ShowModal()
 
+        # drop the pending and running searches of the closed dialog.
+        if self.debounce is not None:
+            self.debounce.Stop()
+        with self._generation_lock:
+            self.generation += 1
+
         # self.frame.Destroy()
         # self.frame = None
         return t
\ No newline at end of file
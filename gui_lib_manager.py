@@ -1,10 +1,14 @@
 import wx
-from helper.footprint import FootprintManager, create_footprint
-from helper.schematic import create_schematic, SchematicManager
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from helper.footprint import FootprintManager
+from helper.schematic import SchematicManager
 from helper.schematic import SchematicExist, SchematicNotFound
+from helper.component import LCComponent, LCUUIDComponent
 
 import logging
-import requests
 
 from KicadModTree import Model
 from logging import Handler, Formatter
@@ -25,196 +29,34 @@ class CMHandler(Handler):
 
     def emit(self, record):
         msg = self.format(record)
-        self.status_write_func(msg)
+        # records may come from the export worker.
+        wx.CallAfter(self.status_write_func, msg)
 
 
-class LCComponent:
+class ExportCancelled(Exception):
+    pass
 
-    def __init__(self, lcid, lc_data=None):
-        self.lcid = lcid
-        self.lc_data = lc_data
-        self.raw_data = None
-        self.footprint = None
-        self.symbol = None
 
-    @property
-    def model3d_name(self):
-        if self.footprint is None:
-            logger.warning("3DModel Name not avaliable.")
-            return ""
+class ExportJob:
+    """
+    A load / generate run on the export worker. cancel() only sets a flag,
+    the worker stops at its next step and the result is dropped.
+    """
 
-        return self.footprint['dataStr']['head']['c_para'].get('3DModel', "")
+    def __init__(self, name):
+        self.name = name
+        self._cancelled = threading.Event()
 
     @property
-    def footprint_name(self):
-        if self.footprint is None:
-            logger.warning("Footprint Name not avaliable.")
-            return ""
-
-        # title = self.raw_data.get('title', self.lcid)
-        return self.footprint['title']
-
-    @property
-    def symbol_name(self):
-        if self.symbol is None:
-            logger.warning("Symbol Name not avaliable.")
-            return ""
-
-        return self.symbol['head']['c_para']['name']
-
-    def load_componnt(self):
-        logger.info("Load Component -> %s", self.lcid)
-
-        req = requests.get(
-            f"https://easyeda.com/api/products/{self.lcid}/components"
-        )
-
-        data = req.json()
-
-        if data['code'] != 0:
-            logger.critical(
-                "Unable to load component %s. Code: %s",
-                self.lcid,
-                data['message']
-            )
-            return False
-
-        self.raw_data = data['result']
-
-        self.symbol = self.raw_data['dataStr']
-        self.footprint = self.raw_data['packageDetail']
-
-        return True
-
-    def calc_symbol_size(self, scale=10):
-        if self.symbol is None:
-            return "Symbol not Avalible."
-
-        box = self.symbol['BBox']
-        bh = box['height'] * scale * 0.00254
-        bw = box['width'] * scale * 0.00254
-        ret = f"{bw:.2f} mm * {bh:.2f} mm"
-
-        return ret
-
-    def gen_footprint_data(self, footprint_name):
-        if self.footprint is None:
-            logger.critical("Cannot Generate Footprint. Data Not Avalible.")
-            return None
-
-        assembly_process = self.raw_data.get('SMT', False)
-        box = self.footprint['dataStr']['BBox']
-        canvas = self.footprint['dataStr']['canvas']
-        canvas = canvas.split("~")
-
-        data = create_footprint(
-            footprint_name,
-            self.footprint['dataStr']['shape'],
-            assembly_process,
-            c_x=float(canvas[16]),
-            c_y=float(canvas[17]),
-            size_x=float(box['width']),
-            size_y=float(box['height'])
-        )
-
-        data.setDescription(f"{footprint_name} footprint")
-        # data.setTags(f"{footprint_name} footprint")
-
-        return data
-
-    def get_datasheet(self):
-        datasheet = self.footprint['dataStr']['head']['c_para']['link']    # type: ignore
-        if self.lc_data:
-            datasheet = self.lc_data['pdfUrl']
-
-        return datasheet
-
-    def gen_symbol_data(
-        self,
-        symbol_name,
-        footprint_name,
-        scale=10
-    ):
-        if self.symbol is None:
-            logger.critical("Cannot Generate Symbol Data. No Symbol Avalible.")
-            return None
-
-        box = self.symbol['BBox']
-        symmbolic_prefix = self.symbol['head']['c_para']['pre']
-        manufacturer = self.symbol['head']['c_para']['Manufacturer']
-        datasheet_link = self.get_datasheet()
-        category = " - "
-        desc = self.raw_data['description']     # type: ignore
-        if desc == "" and self.lc_data:
-            lc_desc = self.lc_data.get('productIntroEn', "")
-            if lc_desc:
-                desc = lc_desc
-
-        # get datasheet
-        if self.lc_data is not None:
-            category = f"{self.lc_data['parentCatalogName']} - {self.lc_data['catalogName']}"
-
-        canvas = self.symbol['canvas']
-        canvas = canvas.split("~")
-
-        return create_schematic(
-            lcid=self.lcid,
-            schematic_title=symbol_name,
-            schematic_shape=self.symbol['shape'],
-            symmbolic_prefix=symmbolic_prefix,
-            footprint_name=footprint_name,
-            datasheet_link=datasheet_link,
-            # x_offset=box['x'],
-            # y_offset=box['y'],
-            x_offset=canvas[13],
-            y_offset=canvas[14],
-            x_size=box['width'],
-            y_size=box['height'],
-            scale=scale,
-            desc=desc,
-            category=category,
-            manufacturer=manufacturer
-        )
-
-
-class LCUUIDComponent(LCComponent):
-    def __init__(self, part_uuid, source_easyeda=True):
-        self.lcid = part_uuid
-        self.lc_data = None
-        self.raw_data = None
-        self.footprint = None
-        self.symbol = None
-        self.source_easyeda = source_easyeda
+    def cancelled(self):
+        return self._cancelled.is_set()
 
-    def load_componnt(self):
-        logger.info("Load Component -> %s", self.lcid)
+    def cancel(self):
+        self._cancelled.set()
 
-        url = f"https://easyeda.com/api/components/{self.lcid}"
-
-        if not self.source_easyeda:
-            url = f"https://lceda.cn/api/components/{self.lcid}"
-
-        req = requests.get(url)
-
-        data = req.json()
-
-        if data['code'] != 0:
-            logger.critical(
-                "Unable to load component %s. Code: %s",
-                self.lcid,
-                data['message']
-            )
-            return False
-
-        self.raw_data = data['result']
-
-        if self.raw_data['docType'] == 2:
-            self.symbol = self.raw_data['dataStr']
-            self.footprint = self.raw_data['packageDetail']
-        elif self.raw_data['docType'] == 4:
-            self.footprint = self.raw_data
-
-        return True
+    def check(self):
+        if self.cancelled:
+            raise ExportCancelled()
 
 
 class LibManagerFrame(wx.Dialog):
@@ -404,6 +246,9 @@ class LibManagerFrame(wx.Dialog):
         )
         sizer_log.Add(self.txt_ctl_log, 1, wx.EXPAND, 0)
 
+        self.gauge = wx.Gauge(self.panel_1, wx.ID_ANY, 100)
+        sizer_left_panel.Add(self.gauge, 0, wx.EXPAND, 0)
+
         sizer_1.Add((10, 20), 0, 0, 0)
 
         sizer_2 = wx.BoxSizer(wx.VERTICAL)
@@ -419,6 +264,12 @@ class LibManagerFrame(wx.Dialog):
         self.btn_gen.Disable()
         sizer_2.Add(self.btn_gen, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
 
+        sizer_2.AddSpacer(10)
+
+        self.btn_cancel = wx.Button(self.panel_1, wx.ID_ANY, "Cancel")
+        self.btn_cancel.Disable()
+        sizer_2.Add(self.btn_cancel, 0, wx.ALIGN_CENTER_HORIZONTAL, 0)
+
         sizer_2.Add((100, 100), 0, 0, 0)
 
         self.btn_close = wx.Button(self.panel_1, wx.ID_ANY, "Close")
@@ -444,7 +295,16 @@ class LibManagerControl:
         self.schematic_manager = None
         self.frame = None
         self.component = None
+        self.component_loaded = False
         self.cx_handler = None
+        # load / generate run here, off the wx event handlers. one worker,
+        # the library files have a single writer.
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="libexport"
+        )
+        self.job = None
+        # jobs on the worker, cancelled ones included.
+        self.running_jobs = 0
 
     def disable_all_children(self, parent):
         for children in parent.GetChildren():
@@ -460,12 +320,79 @@ class LibManagerControl:
             elif children.IsSizer():
                 self.enable_all_children(children.GetSizer())
 
-    def gen_symbol(self, symbol_name, footprint_name):
-        symbol_enabled = self.frame.cb_symbol.GetValue()
-        if not symbol_enabled:
-            logger.info("Skip Symbol Generate.")
+    def start_job(self, name, func, on_done, *args):
+        """
+        Run func(job, *args) on the export worker, on_done(result) is then
+        called on the UI thread, unless the job failed or was cancelled.
+        """
+        job = ExportJob(name)
+        self.job = job
+        self.running_jobs += 1
+        self.set_busy(True)
+        self.executor.submit(self.run_job, job, func, on_done, args)
+        return job
+
+    def run_job(self, job, func, on_done, args):
+        try:
+            result = func(job, *args)
+        except ExportCancelled:
+            logger.info("%s Cancelled.", job.name)
+            on_done = None
+            result = None
+        except Exception:
+            logger.exception("%s Failed.", job.name)
+            on_done = None
+            result = None
+
+        wx.CallAfter(self.finish_job, job, on_done, result)
+
+    def finish_job(self, job, on_done, result):
+        self.running_jobs -= 1
+        if self.frame is None:
+            return
+
+        if job is not self.job:
+            # a cancelled job is done, the library can be changed again.
+            self.enable_lib_controls(self.job is None)
             return
 
+        self.job = None
+        self.set_busy(False)
+        if on_done is not None and not job.cancelled:
+            on_done(result)
+
+    def cancel_job(self, e=None):
+        job = self.job
+        if job is None:
+            return
+
+        logger.info("Cancel %s.", job.name)
+        job.cancel()
+        # the worker result is dropped, the dialog is usable right away. the
+        # library controls stay disabled until the worker has stopped.
+        self.job = None
+        if self.frame is not None:
+            self.set_busy(False)
+
+    def set_busy(self, busy):
+        frame = self.frame
+        frame.btn_load.Enable(not busy)
+        frame.btn_gen.Enable(not busy and self.component_loaded)
+        frame.btn_cancel.Enable(busy)
+        frame.gauge.SetValue(0)
+        self.enable_lib_controls(not busy)
+
+    def enable_lib_controls(self, enable):
+        enable = enable and self.running_jobs == 0
+        self.frame.lib_path_picker.Enable(enable)
+        self.frame.txt_lib_name.Enable(enable)
+
+    def get_managers(self):
+        """
+        Schematic and footprint managers of the current library. Made on the
+        UI thread and handed to the worker, a job keeps writing to the
+        library it was started with.
+        """
         if self.schematic_manager is None:
             logger.info(
                 "Init Schematic Manager. Name: %s, Path: %s.",
@@ -475,85 +402,144 @@ class LibManagerControl:
                 self.lib_root,
                 self.lib_name
             )
-            self.schematic_manager.build_schematic_db()
 
-        scale = int(self.frame.select_symbol_scale.GetStringSelection())
-        symbol_data = self.component.gen_symbol_data(
-            symbol_name, footprint_name, scale)
+        if self.footprint_manager is None:
+            logger.info(
+                "Init Footprint Manager. Name: %s, Path: %s.",
+                self.lib_name,
+                self.lib_root)
+            self.footprint_manager = FootprintManager(
+                self.lib_root,
+                self.lib_name
+            )
 
-        if symbol_data is None:
+        return self.schematic_manager, self.footprint_manager
+
+    def progress(self, job, value):
+        """
+        Report the progress of `job` from the worker, None pulses the gauge.
+        """
+        job.check()
+        wx.CallAfter(self.show_progress, job, value)
+
+    def show_progress(self, job, value):
+        if self.frame is None or job is not self.job:
             return
 
-        try:
-            self.schematic_manager.add_schematic(symbol_name, symbol_data)
-        except SchematicExist:
-            answer = wx.MessageBox(
-                "Schematic Already Exist.\nDo you want to Update?",
+        if value is None:
+            self.frame.gauge.Pulse()
+        else:
+            self.frame.gauge.SetValue(value)
+
+    def confirm(self, job, message):
+        """
+        Yes / No box for the worker, shown on the UI thread. The worker
+        waits for the answer.
+        """
+        answer = Future()
+
+        def ask():
+            if self.frame is None or job.cancelled:
+                answer.set_result(False)
+                return
+
+            ret = wx.MessageBox(
+                message,
                 "Confirm",
                 wx.YES_NO | wx.CANCEL,
                 self.frame
             )
-            if answer == wx.YES:
-                self.schematic_manager.add_schematic(
-                    symbol_name, symbol_data, update=True
-                )
+            answer.set_result(ret == wx.YES)
+
+        wx.CallAfter(ask)
+        ret = answer.result()
+        job.check()
+        return ret
 
-    def gen_footprint(self, footprint_name, model3d_name):
-        footprint_enabled = self.frame.cb_footprint.GetValue()
-        model3d_enabled = self.frame.cb_3dmodal.GetValue()
+    def gen_symbol(
+        self,
+        job,
+        schematic_manager,
+        symbol_name,
+        footprint_name,
+        scale
+    ):
+        schematic_manager.build_schematic_db()
 
-        if not footprint_enabled:
-            logger.info("Skip Footprint & 3D Model Generate.")
+        symbol_data = self.component.gen_symbol_data(
+            symbol_name, footprint_name, scale)
+
+        if symbol_data is None:
             return
 
-        if self.footprint_manager is None:
-            logger.info(
-                "Init Footprint Manager. Name: %s, Path: %s.",
-                self.lib_name,
-                self.lib_root)
-            self.footprint_manager = FootprintManager(
-                self.lib_root,
-                self.lib_name
+        self.progress(job, 20)
+        try:
+            schematic_manager.add_schematic(symbol_name, symbol_data)
+        except SchematicExist:
+            answer = self.confirm(
+                job, "Schematic Already Exist.\nDo you want to Update?"
             )
+            if answer:
+                schematic_manager.add_schematic(
+                    symbol_name, symbol_data, update=True
+                )
+
+        # one index write per generate.
+        schematic_manager.flush_index()
 
+    def gen_footprint(
+        self,
+        job,
+        footprint_manager,
+        footprint_name,
+        model3d_name,
+        model3d_enabled
+    ):
         # check footprint exist or not
-        t = self.footprint_manager.check_footprint(footprint_name)
+        t = footprint_manager.check_footprint(footprint_name)
         if t:
             logger.info("Found Footprint %s", footprint_name)
-            answer = wx.MessageBox(
-                "Footprint Already Exist.\nDo you want to Update?",
-                "Confirm",
-                wx.YES_NO | wx.CANCEL,
-                self.frame
+            answer = self.confirm(
+                job, "Footprint Already Exist.\nDo you want to Update?"
             )
-            if answer != wx.YES:
+            if not answer:
                 return
 
-        footprint_data = self.component.gen_footprint_data(footprint_name)
+        footprint_data = self.component.gen_footprint_data(
+            footprint_name, with_3d=model3d_enabled
+        )
+        self.progress(job, 50)
 
         # 3d model
         if not model3d_enabled:
             logger.info("Skip 3D Model Generate.")
-            # return
 
         model3d_data = footprint_data.c_3d_model    # type: ignore
-        t = self.footprint_manager.check_3d_model(model3d_name)
-        if t and model3d_data:
+        # same model already in the library (under any name), link it.
+        stored = None
+        if model3d_data:
+            stored = footprint_manager.find_3d_model(model3d_data)
+
+        t = footprint_manager.check_3d_model(model3d_name)
+        if stored is not None:
+            logger.info("Reuse 3D Model %s", stored)
+            model3d_name = stored
+        elif t and model3d_data:
             logger.info("Found 3D Model %s", model3d_name)
-            answer = wx.MessageBox(
-                "3D Model Already Exist.\nDo you want to Update?",
-                "Confirm",
-                wx.YES_NO | wx.CANCEL,
-                self.frame
+            answer = self.confirm(
+                job, "3D Model Already Exist.\nDo you want to Update?"
             )
-            if answer != wx.YES:
+            if not answer:
                 model3d_data = None
 
         if model3d_data:
-            self.footprint_manager.add_3d_model(
-                model3d_name, model3d_data, True
-            )
-            model_path = self.footprint_manager.get_3d_model_ref_path(model3d_name)
+            if stored is None:
+                # waits for the model download.
+                model3d_name = footprint_manager.add_3d_model(
+                    model3d_name, model3d_data, True
+                )
+                self.progress(job, 90)
+            model_path = footprint_manager.get_3d_model_ref_path(model3d_name)
             footprint_data.append(
                 Model(
                     filename=model_path,
@@ -561,7 +547,7 @@ class LibManagerControl:
                 )
             )
 
-        self.footprint_manager.add_footprint(
+        footprint_manager.add_footprint(
             footprint_name, footprint_data, update=True
         )
 
@@ -572,7 +558,7 @@ class LibManagerControl:
             wx.MessageBox(
                 "Library name is empty", 'Error', wx.OK | wx.ICON_ERROR
             )
-            return
+            return False
 
         if lib_name != self.lib_name and lib_name != 'lcsc':
             self.save_lib_name(lib_name)
@@ -583,26 +569,96 @@ class LibManagerControl:
             wx.MessageBox(
                 "Library path is empty", 'Error', wx.OK | wx.ICON_ERROR
             )
-            return
+            return False
+
+        return True
 
     def do_component_gen(self, e):
-        self.check_lib_path()
+        if not self.check_lib_path():
+            return
+
+        # widgets and managers are read here, the worker only gets values.
+        frame = self.frame
+        schematic_manager, footprint_manager = self.get_managers()
+        self.start_job(
+            "Component Generate",
+            self.gen_component,
+            self.show_generated,
+            schematic_manager,
+            footprint_manager,
+            frame.txt_symbol_name.GetValue(),
+            frame.txt_footprint_name.GetValue(),
+            frame.txt_3dmodel_name.GetValue(),
+            frame.cb_symbol.GetValue(),
+            int(frame.select_symbol_scale.GetStringSelection()),
+            frame.cb_footprint.GetValue(),
+            frame.cb_3dmodal.GetValue()
+        )
 
-        symbol_name = self.frame.txt_symbol_name.GetValue()
-        footprint_name = self.frame.txt_footprint_name.GetValue()
-        model3d_name = self.frame.txt_3dmodel_name.GetValue()
+    def gen_component(
+        self,
+        job,
+        schematic_manager,
+        footprint_manager,
+        symbol_name,
+        footprint_name,
+        model3d_name,
+        symbol_enabled,
+        scale,
+        footprint_enabled,
+        model3d_enabled
+    ):
+        self.progress(job, 0)
+
+        # the 3D model downloads while the symbol is generated.
+        session = self.component.session
+        if footprint_enabled and model3d_enabled and session is not None:
+            try:
+                session.model3d()
+            except Exception as e:
+                # the footprint generation downloads it again.
+                logger.warning("3D Model prefetch failed. %s", e)
+
+        if symbol_enabled:
+            self.gen_symbol(
+                job, schematic_manager, symbol_name, footprint_name, scale
+            )
+        else:
+            logger.info("Skip Symbol Generate.")
+        self.progress(job, 30)
+
+        if footprint_enabled:
+            self.gen_footprint(
+                job,
+                footprint_manager,
+                footprint_name,
+                model3d_name,
+                model3d_enabled
+            )
+        else:
+            logger.info("Skip Footprint & 3D Model Generate.")
+        self.progress(job, 100)
 
-        self.gen_symbol(symbol_name, footprint_name)
-        self.gen_footprint(footprint_name, model3d_name)
+    def show_generated(self, result):
         wx.MessageBox(
             "Component Generated.", 'Info', wx.OK | wx.ICON_INFORMATION
         )
 
     def do_load_component(self, e):
-        ret = self.component.load_componnt()      # type: ignore
+        self.start_job(
+            "Load Component", self.load_component, self.show_component
+        )
+
+    def load_component(self, job):
+        self.progress(job, None)
+        return self.component.load_componnt()      # type: ignore
+
+    def show_component(self, ret):
         if not ret:
             return
 
+        self.component_loaded = True
+
         self.enable_all_children(self.frame.symbol_footprint_sizer)
         self.calc_symbol_size()
 
@@ -614,7 +670,7 @@ class LibManagerControl:
         self.frame.txt_3dmodel_name.SetValue(self.component.model3d_name)
 
         # enable generate BTN
-        self.frame.btn_gen.Enable()
+        self.set_busy(False)
 
     def check_box_clicked(self, parent, e):
         if e.IsChecked():
@@ -658,17 +714,29 @@ class LibManagerControl:
 
         self.frame.txt_ctl_log.AppendText(msg)
 
-    def load_part(self, lcid, lc_data=None, direct_part=False, source_easyeda=True):
+    def load_part(
+        self,
+        lcid,
+        lc_data=None,
+        direct_part=False,
+        source_easyeda=True,
+        update_time=None,
+        session=None
+    ):
         if direct_part:
             self.component = LCUUIDComponent(lcid, source_easyeda)
         else:
-            self.component = LCComponent(lcid, lc_data)
+            self.component = LCComponent(
+                lcid, lc_data, update_time, session=session
+            )
+        self.component_loaded = False
 
         self.frame = LibManagerFrame(self.wx_parent, wx.ID_ANY, "")
 
         # Init Binds
         self.frame.btn_gen.Bind(wx.EVT_BUTTON, self.do_component_gen)
         self.frame.btn_load.Bind(wx.EVT_BUTTON, self.do_load_component)
+        self.frame.btn_cancel.Bind(wx.EVT_BUTTON, self.cancel_job)
         self.frame.select_symbol_scale.Bind(
             wx.EVT_COMBOBOX, self.calc_symbol_size
         )
@@ -710,5 +778,7 @@ class LibManagerControl:
         self.disable_all_children(self.frame.symbol_footprint_sizer)
 
         t = self.frame.ShowModal()
+        # a run still going is dropped with the dialog.
+        self.cancel_job()
         self.frame.Destroy()
         self.frame = None
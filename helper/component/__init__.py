@@ -0,0 +1,2 @@
+from .component import LCComponent, LCUUIDComponent
+from .session import PartSession
@@ -0,0 +1,229 @@
+import logging
+
+from ..footprint import create_footprint, get_footprint_memo
+from ..footprint import NAME_TOKEN
+from ..schematic import create_schematic
+from ..network import fetch_product_components, fetch_component
+
+
+logger = logging.getLogger("KICONV")
+
+
+class LCComponent:
+
+    def __init__(self, lcid, lc_data=None, update_time=None, session=None):
+        self.lcid = lcid
+        self.lc_data = lc_data
+        self.update_time = update_time
+        # PartSession, shares the fetched components with the main window.
+        self.session = session
+        self.raw_data = None
+        self.footprint = None
+        self.symbol = None
+
+    @property
+    def model3d_name(self):
+        if self.footprint is None:
+            logger.warning("3DModel Name not avaliable.")
+            return ""
+
+        return self.footprint['dataStr']['head']['c_para'].get('3DModel', "")
+
+    @property
+    def footprint_name(self):
+        if self.footprint is None:
+            logger.warning("Footprint Name not avaliable.")
+            return ""
+
+        # title = self.raw_data.get('title', self.lcid)
+        return self.footprint['title']
+
+    @property
+    def symbol_name(self):
+        if self.symbol is None:
+            logger.warning("Symbol Name not avaliable.")
+            return ""
+
+        return self.symbol['head']['c_para']['name']
+
+    def load_componnt(self):
+        logger.info("Load Component -> %s", self.lcid)
+
+        if self.session is not None:
+            data = self.session.components(self.update_time)
+        else:
+            data = fetch_product_components(self.lcid, self.update_time)
+
+        if data['code'] != 0:
+            logger.critical(
+                "Unable to load component %s. Code: %s",
+                self.lcid,
+                data['message']
+            )
+            return False
+
+        self.raw_data = data['result']
+
+        self.symbol = self.raw_data['dataStr']
+        self.footprint = self.raw_data.get('packageDetail')
+
+        return True
+
+    def calc_symbol_size(self, scale=10):
+        if self.symbol is None:
+            return "Symbol not Avalible."
+
+        box = self.symbol['BBox']
+        bh = box['height'] * scale * 0.00254
+        bw = box['width'] * scale * 0.00254
+        ret = f"{bw:.2f} mm * {bh:.2f} mm"
+
+        return ret
+
+    def _create_footprint(self, footprint_name, merge_tracks, with_3d):
+        assembly_process = self.raw_data.get('SMT', False)
+        box = self.footprint['dataStr']['BBox']
+        canvas = self.footprint['dataStr']['canvas']
+        canvas = canvas.split("~")
+
+        return create_footprint(
+            footprint_name,
+            self.footprint['dataStr']['shape'],
+            assembly_process,
+            c_x=float(canvas[16]),
+            c_y=float(canvas[17]),
+            size_x=float(box['width']),
+            size_y=float(box['height']),
+            merge_tracks=merge_tracks,
+            with_3d=with_3d
+        )
+
+    def gen_footprint_data(
+        self,
+        footprint_name,
+        merge_tracks=True,
+        with_3d=True,
+        memo=True
+    ):
+        """
+        Footprint of the part. With `memo`, a package already converted
+        (same EasyEDA footprint uuid and updateTime) is reused and returned
+        as a SerializedFootprint with the name patched.
+        """
+        if self.footprint is None:
+            logger.critical("Cannot Generate Footprint. Data Not Avalible.")
+            return None
+
+        uuid = self.footprint.get('uuid')
+        if memo and uuid:
+            key = (
+                uuid,
+                self.footprint.get('updateTime'),
+                self.raw_data.get('SMT', False),
+                merge_tracks,
+                with_3d
+            )
+            template = get_footprint_memo().get(
+                key,
+                lambda: self._create_footprint(NAME_TOKEN, merge_tracks, with_3d)
+            )
+            return template.instantiate(
+                footprint_name, f"{footprint_name} footprint"
+            )
+
+        data = self._create_footprint(footprint_name, merge_tracks, with_3d)
+        data.setDescription(f"{footprint_name} footprint")
+        # data.setTags(f"{footprint_name} footprint")
+
+        return data
+
+    def get_datasheet(self):
+        datasheet = ""
+        if self.footprint is not None:
+            datasheet = self.footprint['dataStr']['head']['c_para']['link']
+        if self.lc_data:
+            datasheet = self.lc_data['pdfUrl']
+
+        return datasheet
+
+    def gen_symbol_data(
+        self,
+        symbol_name,
+        footprint_name,
+        scale=10
+    ):
+        if self.symbol is None:
+            logger.critical("Cannot Generate Symbol Data. No Symbol Avalible.")
+            return None
+
+        box = self.symbol['BBox']
+        symmbolic_prefix = self.symbol['head']['c_para']['pre']
+        manufacturer = self.symbol['head']['c_para']['Manufacturer']
+        datasheet_link = self.get_datasheet()
+        category = " - "
+        desc = self.raw_data['description']     # type: ignore
+        if desc == "" and self.lc_data:
+            lc_desc = self.lc_data.get('productIntroEn', "")
+            if lc_desc:
+                desc = lc_desc
+
+        # get datasheet
+        if self.lc_data is not None:
+            category = f"{self.lc_data['parentCatalogName']} - {self.lc_data['catalogName']}"
+
+        canvas = self.symbol['canvas']
+        canvas = canvas.split("~")
+
+        return create_schematic(
+            lcid=self.lcid,
+            schematic_title=symbol_name,
+            schematic_shape=self.symbol['shape'],
+            symmbolic_prefix=symmbolic_prefix,
+            footprint_name=footprint_name,
+            datasheet_link=datasheet_link,
+            # x_offset=box['x'],
+            # y_offset=box['y'],
+            x_offset=canvas[13],
+            y_offset=canvas[14],
+            x_size=box['width'],
+            y_size=box['height'],
+            scale=scale,
+            desc=desc,
+            category=category,
+            manufacturer=manufacturer
+        )
+
+
+class LCUUIDComponent(LCComponent):
+    def __init__(self, part_uuid, source_easyeda=True):
+        self.lcid = part_uuid
+        self.lc_data = None
+        self.update_time = None
+        self.session = None
+        self.raw_data = None
+        self.footprint = None
+        self.symbol = None
+        self.source_easyeda = source_easyeda
+
+    def load_componnt(self):
+        logger.info("Load Component -> %s", self.lcid)
+
+        data = fetch_component(self.lcid, self.source_easyeda)
+
+        if data['code'] != 0:
+            logger.critical(
+                "Unable to load component %s. Code: %s",
+                self.lcid,
+                data['message']
+            )
+            return False
+
+        self.raw_data = data['result']
+
+        if self.raw_data['docType'] == 2:
+            self.symbol = self.raw_data['dataStr']
+            self.footprint = self.raw_data.get('packageDetail')
+        elif self.raw_data['docType'] == 4:
+            self.footprint = self.raw_data
+
+        return True
@@ -0,0 +1,110 @@
+import json
+import logging
+import threading
+
+from concurrent.futures import Future
+
+from ..footprint.model3d import WRLModel
+from ..network import fetch_product_components, fetch_product_detail
+from ..network import fetch_product_svgs, http_get
+
+
+logger = logging.getLogger("NETWORK")
+
+
+class PartSession:
+    """
+    Payloads fetched for one part during a user flow (search, previews,
+    export dialog): components, svgs, product detail, product image and
+    the 3D model.
+
+    Each payload is fetched once, concurrent callers wait for the same
+    request. A failed fetch is tried again by the next caller.
+    """
+
+    def __init__(self, lcid):
+        self.lcid = lcid.upper()
+        self._lock = threading.Lock()
+        # name -> Future
+        self._payloads = {}
+
+    def _get(self, name, fetch):
+        with self._lock:
+            future = self._payloads.get(name)
+            owner = future is None
+            if owner:
+                future = self._payloads[name] = Future()
+
+        if owner:
+            try:
+                future.set_result(fetch())
+            except BaseException as e:
+                with self._lock:
+                    del self._payloads[name]
+                future.set_exception(e)
+
+        return future.result()
+
+    def components(self, update_time=None):
+        return self._get(
+            'components',
+            lambda: fetch_product_components(self.lcid, update_time)
+        )
+
+    def svgs(self):
+        return self._get('svgs', lambda: fetch_product_svgs(self.lcid))
+
+    def product_detail(self):
+        return self._get('detail', lambda: fetch_product_detail(self.lcid))
+
+    def product_image(self, url):
+        """
+        Image bytes, None if it cannot be downloaded.
+        """
+        def fetch():
+            req = http_get(url)
+            if req.status_code != 200:
+                return None
+            return req.content
+
+        return self._get(('image', url), fetch)
+
+    def model3d(self):
+        """
+        WRLModel of the footprint, its download started, None if the part
+        has none.
+        """
+        return self._get('model3d', self._start_model3d)
+
+    def _start_model3d(self):
+        data = self.components()
+        if data['code'] != 0:
+            return None
+
+        package = data['result'].get('packageDetail') or {}
+        shapes = package.get('dataStr', {}).get('shape', [])
+        for shape in shapes:
+            if not shape.startswith("SVGNODE~"):
+                continue
+
+            # same download as the WRLModel made by the footprint.
+            attrs = json.loads(shape.split("~")[1])["attrs"]
+            model = WRLModel(attrs["uuid"], attrs["z"])
+            model.start_download()
+            return model
+
+        return None
+
+    def prefetch(self, executor):
+        """
+        Start loading the components on `executor`, nothing is fetched twice
+        later on. The 3D model is only fetched by an export with 3D
+        enabled, see model3d().
+        """
+        return executor.submit(self._prefetch)
+
+    def _prefetch(self):
+        try:
+            self.components()
+        except Exception:
+            logger.warning("Part Session: prefetch of %s failed.", self.lcid)
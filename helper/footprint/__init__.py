@@ -1,2 +1,4 @@
 from .footprint import create_footprint
-from .manager import FootprintManager
\ No newline at end of file
+from .manager import FootprintManager
+from .memo import get_footprint_memo, FootprintMemo, SerializedFootprint
+from .memo import NAME_TOKEN
@@ -3,7 +3,7 @@
 import logging
 
 from KicadModTree import Footprint, Text, Translation
-from .footprint_handlers import FOOTPRINT_HANDLER
+from .footprint_handlers import FOOTPRINT_HANDLER, FOOTPRINT_BATCH_HANDLER
 
 
 logger = logging.getLogger("KICONV")
@@ -15,7 +15,9 @@ class FootprintInfo():
         footprint_name,
         assembly_process,
         c_x=0,
-        c_y=0
+        c_y=0,
+        merge_tracks=True,
+        with_3d=True
     ):
         # # I will be using these to calculate the bounding box
         # because the node.calculateBoundingBox() methode does not
@@ -28,6 +30,10 @@ class FootprintInfo():
         self.c_y = c_y
         self._assembly_process = assembly_process
         self.footprint_name = footprint_name
+        # merge contiguous / collinear track segments.
+        self.merge_tracks = merge_tracks
+        # no 3D model (SVGNODE) when disabled.
+        self.with_3d = with_3d
 
     def assembly_process(self):
         if self._assembly_process is True:
@@ -35,6 +41,61 @@ class FootprintInfo():
         return None
 
 
+def group_shapes(footprint_shape):
+    """
+    Tokenize the shape lines and group the records by shape type.
+
+    Returns {model: [(index, args), ...]}, index is the line number
+    in footprint_shape.
+    """
+    groups = {}
+    for index, line in enumerate(footprint_shape):
+        # split and remove empty string in list
+        args = [i for i in line.split("~") if i]
+        if not args:
+            continue
+
+        model = args[0]
+        logger.debug("Footprint: args->%s", args)
+        if model not in FOOTPRINT_HANDLER:
+            logger.warning("Footprint: model not in handler->%s", model)
+            continue
+
+        groups.setdefault(model, []).append((index, args[1:]))
+
+    return groups
+
+
+def build_shape_nodes(footprint_shape, kicad_mod, footprint_info):
+    """
+    Build the nodes of every shape, sorted back in the shape order.
+
+    TRACK / PAD / CIRCLE / HOLE go through the batch handlers, the
+    other types are built record by record.
+    """
+    nodes = []
+    for model, records in group_shapes(footprint_shape).items():
+        if model in FOOTPRINT_BATCH_HANDLER:
+            nodes.extend(FOOTPRINT_BATCH_HANDLER[model](records, footprint_info))
+            continue
+
+        if model == "SVGNODE" and not footprint_info.with_3d:
+            logger.info("Footprint: 3D model disabled, skip SVGNODE.")
+            continue
+
+        build_func = FOOTPRINT_HANDLER[model]
+        for index, args in records:
+            sink = []
+            ret = build_func(args, sink, footprint_info)
+            if model == "SVGNODE":
+                kicad_mod.c_3d_model, kicad_mod.c_3d_model_rotation = ret
+            nodes.extend((index, node) for node in sink)
+
+    # stable sort, nodes of one record keep their order.
+    nodes.sort(key=lambda x: x[0])
+    return nodes
+
+
 def create_footprint(
     footprint_name,
     footprint_shape,
@@ -42,7 +103,9 @@ def create_footprint(
     c_x=0,
     c_y=0,
     size_x=0,
-    size_y=0
+    size_y=0,
+    merge_tracks=True,
+    with_3d=True
 ):
     logger.info("Footprint: creating footprint ...")
 
@@ -65,25 +128,14 @@ def create_footprint(
         footprint_name=footprint_name,
         assembly_process=assembly_process,
         c_x=c_x,
-        c_y=c_y
+        c_y=c_y,
+        merge_tracks=merge_tracks,
+        with_3d=with_3d
     )
 
-    # for each line in data : use the appropriate handler
-    for line in footprint_shape:
-        # split and remove empty string in list
-        args = [i for i in line.split("~") if i]
-        model = args[0]
-        logger.debug("Footprint: args->%s", args)
-        if model not in FOOTPRINT_HANDLER:
-            logger.warning("Footprint: model not in handler->%s", model)
-            continue
-
-        if model == "SVGNODE":
-            func = FOOTPRINT_HANDLER.get("SVGNODE")
-            kicad_mod.c_3d_model, kicad_mod.c_3d_model_rotation = func(args[1:], kicad_mod, footprint_info)    # type: ignore
-        else:
-            build_func = FOOTPRINT_HANDLER.get(model)
-            build_func(args[1:], kicad_mod, footprint_info)     # type: ignore
+    # group the shapes by type, then build each group in one go.
+    for index, node in build_shape_nodes(footprint_shape, kicad_mod, footprint_info):
+        kicad_mod.append(node)
 
     # set general values
     kicad_mod.append(
@@ -2,11 +2,13 @@ import json
 import math
 import logging
 
+import numpy as np
+
 from KicadModTree import *
 from .model3d import get_3Dmodel
-
-from svg.path import parse_path
-from svg.path import Arc as svg_ARC
+from .numeric import round_array
+from ..svgpath import parse_path
+from ..svgpath import Arc as svg_ARC
 
 
 logger = logging.getLogger("KICONV")
@@ -46,104 +48,309 @@ def pmil2mm(x):
     return round(float(x) * 10 * 0.0254, 2)
 
 
-def h_TRACK(data, kicad_mod, footprint_info):
-    width = pmil2mm(data[0])
+def mil2mm_points(points, footprint_info):
+    """
+    Batched mil2mm for a flat [x, y, x, y, ...] list of strings.
 
-    # points = [mil2mm(p) for p in data[2].split(" ")]
-    points = data[2].split(" ")
-    nodes = []
+    Returns [(x, y), ...], same values as calling mil2mm per point.
+    """
+    count = len(points) // 2
+    if count == 0:
+        return []
 
-    for x, y in zip(*[iter(points)] * 2):
-        nodes.append(mil2mm(x, y, footprint_info))
+    data = np.array(points[:count * 2], dtype=np.float64).reshape(count, 2)
+    data = (data - (footprint_info.c_x, footprint_info.c_y)) * 10 * 0.0254
 
-    for i in range(len(nodes) - 1):
+    return [tuple(p) for p in round_array(data).tolist()]
 
-        start = nodes[i]
-        end = nodes[i + 1]
 
-        try:
-            layer = layer_correspondance[data[1]]
-        except:
-            logger.exception(
-                "Footprint(h_TRACK): layer correspondance not found."
+def pmil2mm_column(values, factor=1):
+    """
+    Batched pmil2mm(float(x) * factor) for a column of strings.
+    """
+    data = np.array(values, dtype=np.float64)
+    if factor != 1:
+        data = data * factor
+
+    return round_array(data * 10 * 0.0254).tolist()
+
+
+def get_layer(layer_id, handler):
+    try:
+        return layer_correspondance[layer_id]
+    except KeyError:
+        logger.exception(
+            "Footprint(%s): layer correspondance not found.", handler
+        )
+        return "F.SilkS"
+
+
+def _collinear(a, b, c):
+    # b is on the straight segment a -> c, going the same direction.
+    ux, uy = b[0] - a[0], b[1] - a[1]
+    vx, vy = c[0] - b[0], c[1] - b[1]
+    cross = ux * vy - uy * vx
+    dot = ux * vx + uy * vy
+    return dot > 0 and abs(cross) <= 1e-9 * math.hypot(ux, uy) * math.hypot(vx, vy)
+
+
+def simplify_polyline(points):
+    """
+    Drop repeated points and the middle points of collinear runs.
+    """
+    result = []
+    for p in points:
+        if result and p == result[-1]:
+            continue
+        if len(result) >= 2 and _collinear(result[-2], result[-1], p):
+            result[-1] = p
+            continue
+        result.append(p)
+
+    # single point track, keep the zero length line.
+    if len(result) == 1 and len(points) > 1:
+        result.append(result[0])
+
+    return result
+
+
+def merge_tracks(tracks):
+    """
+    Merge track polylines, tracks are [(index, layer, width, points), ...]
+    in shape order.
+
+    A track that starts (or ends) where the previous one on the same layer
+    with the same width ends is joined to it, then collinear segments are
+    merged. KiCad has no open polyline for footprints (fp_poly is always
+    closed, even with (fill none)), so the result is still drawn as
+    fp_line, only with fewer segments.
+    """
+    merged = []
+    for index, layer, width, points in tracks:
+        if len(points) < 2:
+            continue
+
+        if merged:
+            _, p_layer, p_width, p_points = merged[-1]
+            if p_layer == layer and p_width == width:
+                if points[0] == p_points[-1]:
+                    p_points.extend(points[1:])
+                    continue
+                if points[-1] == p_points[-1]:
+                    p_points.extend(points[-2::-1])
+                    continue
+
+        merged.append((index, layer, width, list(points)))
+
+    return [
+        (index, layer, width, simplify_polyline(points))
+        for index, layer, width, points in merged
+    ]
+
+
+# Batch handlers take every record of one shape type at once,
+# records are (index, args) and they return [(index, node), ...].
+# The index keeps the original shape order when the nodes are appended.
+
+def hb_TRACK(records, footprint_info):
+    points = []
+    counts = []
+    for _, data in records:
+        # points = [mil2mm(p) for p in data[2].split(" ")]
+        track_points = data[2].split(" ")
+        count = len(track_points) // 2
+        points.extend(track_points[:count * 2])
+        counts.append(count)
+
+    nodes = mil2mm_points(points, footprint_info)
+    widths = pmil2mm_column([data[0] for _, data in records])
+
+    tracks = []
+    pos = 0
+    for (index, data), count, width in zip(records, counts, widths):
+        layer = get_layer(data[1], "h_TRACK")
+        tracks.append((index, layer, width, nodes[pos:pos + count]))
+        pos += count
+
+    if footprint_info.merge_tracks:
+        tracks = merge_tracks(tracks)
+
+    result = []
+    for index, layer, width, points in tracks:
+        for i in range(len(points) - 1):
+            result.append((
+                index,
+                Line(
+                    start=points[i],
+                    end=points[i + 1],
+                    width=width,
+                    layer=layer
+                )
+            ))
+
+    return result
+
+
+PAD_SHAPE_CORRESPONDANCE = {
+    "OVAL": "SHAPE_OVAL",
+    "RECT": "SHAPE_RECT",
+    "ELLIPSE": "SHAPE_CIRCLE",
+    "POLYGON": "SHAPE_CUSTOM",
+}
+
+
+def hb_PAD(records, footprint_info):
+    positions = mil2mm_points(
+        [v for _, data in records for v in (data[1], data[2])],
+        footprint_info
+    )
+    sizes = pmil2mm_column([v for _, data in records for v in (data[3], data[4])])
+    holes = [float(data[7]) for _, data in records]
+    drills = pmil2mm_column(holes, 2)
+
+    # all custom pad outlines in one go.
+    polygon_points = []
+    polygon_counts = []
+    for _, data in records:
+        if data[0] == "POLYGON":
+            ori_points = data[8].split(" ")
+            count = len(ori_points) // 2
+            polygon_points.extend(ori_points[:count * 2])
+            polygon_counts.append(count)
+    polygon_nodes = mil2mm_points(polygon_points, footprint_info)
+    polygon_pos = 0
+
+    result = []
+    for i, (index, data) in enumerate(records):
+        rotation = 0
+        primitives = ""
+        pad_shape = "SHAPE_OVAL"
+        pad_drill = None
+        pad_type = Pad.TYPE_SMT
+        pad_layer = Pad.LAYERS_SMT
+        pad_number = data[6]
+
+        # back layer
+        if data[5] == "2":
+            pad_layer = ['B.Cu', 'B.Mask']
+
+        if holes[i] > 0:
+            pad_type = Pad.TYPE_THT
+            pad_layer = Pad.LAYERS_THT
+            pad_drill = drills[i]
+            # pad_drill_h = pmil2mm(float(data[11]))
+            # if pad_drill_h > 0:
+            #     pad_drill = (pad_drill_h, pad_drill)
+
+        if data[0] in PAD_SHAPE_CORRESPONDANCE:
+            pad_shape = PAD_SHAPE_CORRESPONDANCE[data[0]]
+        else:
+            logger.error("Footprint(PAD): no correspondance found, using defualt SHAPE_OVAL.")
+
+        if pad_shape == "SHAPE_OVAL":
+            rotation = float(data[9])
+        elif pad_shape == "SHAPE_CUSTOM":
+            count = polygon_counts.pop(0)
+            nodes = polygon_nodes[polygon_pos:polygon_pos + count]
+            polygon_pos += count
+            primitives = [Polygon(nodes=nodes)]
+        elif pad_shape == "SHAPE_CIRCLE":
+            pass
+        elif pad_shape == "SHAPE_RECT":
+            rotation = float(data[9])
+
+        result.append((
+            index,
+            Pad(
+                number=pad_number,
+                type=pad_type,
+                shape=getattr(Pad, pad_shape),
+                at=positions[i],
+                size=(sizes[i * 2], sizes[i * 2 + 1]),
+                rotation=rotation,
+                drill=pad_drill,
+                layers=pad_layer,
+                primitives=primitives
             )
+        ))
+
+    return result
+
+
+def hb_CIRCLE(records, footprint_info):
+    # they want to draw a circle on pads, we don't want that.
+    # This is an empirical deduction, no idea if this is correct,
+    # but it seems to work on my tests
+    records = [x for x in records if x[1][4] != "100"]
+    if not records:
+        return []
+
+    centers = mil2mm_points(
+        [v for _, data in records for v in (data[0], data[1])],
+        footprint_info
+    )
+    radius = pmil2mm_column([data[2] for _, data in records])
+    widths = pmil2mm_column([data[3] for _, data in records])
+
+    result = []
+    for i, (index, data) in enumerate(records):
+        try:
+            layer = layer_correspondance[data[4]]
+        except KeyError:
+            logger.exception('Footprint(Circle): footprint layer correspondance not found')
             layer = "F.SilkS"
 
-        # append line to kicad_mod
-        kicad_mod.append(
-            Line(
-                start=start,
-                end=end,
-                width=width,
+        result.append((
+            index,
+            Circle(
+                center=centers[i],
+                radius=radius[i],
+                width=widths[i],
                 layer=layer
             )
+        ))
+
+    return result
+
+
+def hb_HOLE(records, footprint_info):
+    positions = mil2mm_points(
+        [v for _, data in records for v in (data[0], data[1])],
+        footprint_info
+    )
+    # R -> Dia
+    sizes = pmil2mm_column([data[2] for _, data in records], 2)
+
+    return [
+        (
+            index,
+            Pad(
+                type=Pad.TYPE_NPTH,
+                shape=Pad.SHAPE_CIRCLE,
+                layers=Pad.LAYERS_NPTH,
+                at=positions[i],
+                size=(sizes[i], sizes[i]),
+                drill=sizes[i],
+            )
         )
+        for i, (index, data) in enumerate(records)
+    ]
 
 
-def h_PAD(data, kicad_mod, footprint_info):
-    shape_correspondance = {
-        "OVAL": "SHAPE_OVAL",
-        "RECT": "SHAPE_RECT",
-        "ELLIPSE": "SHAPE_CIRCLE",
-        "POLYGON": "SHAPE_CUSTOM",
-    }
+def _single(batch_func):
+    # per record handler on top of a batch handler.
+    def handler(data, kicad_mod, footprint_info):
+        for _, node in batch_func([(0, data)], footprint_info):
+            kicad_mod.append(node)
 
-    rotation = 0
-    primitives = ""
-    pad_shape = "SHAPE_OVAL"
-    pad_drill = None
-    pad_type = Pad.TYPE_SMT
-    pad_layer = Pad.LAYERS_SMT
-    pad_number = data[6]
-
-    hole_size = float(data[7])
-
-    # back layer
-    if data[5] == "2":
-        pad_layer = ['B.Cu', 'B.Mask']
-
-    if hole_size > 0:
-        pad_type = Pad.TYPE_THT
-        pad_layer = Pad.LAYERS_THT
-        pad_drill = pmil2mm(hole_size * 2)
-        # pad_drill_h = pmil2mm(float(data[11]))
-        # if pad_drill_h > 0:
-        #     pad_drill = (pad_drill_h, pad_drill)
-
-    pad_position = mil2mm(data[1], data[2], footprint_info)
-    pad_size = smil2mm(data[3], data[4])
-
-    if data[0] in shape_correspondance:
-        pad_shape = shape_correspondance[data[0]]
-    else:
-        logger.error("Footprint(PAD): no correspondance found, using defualt SHAPE_OVAL.")
-
-    if pad_shape == "SHAPE_OVAL":
-        rotation = float(data[9])
-    elif pad_shape == "SHAPE_CUSTOM":
-        nodes = []
-        ori_points = data[8].split(" ")
-        for x, y in zip(*[iter(ori_points)] * 2):
-            nodes.append(mil2mm(x, y, footprint_info))
-        primitives = [Polygon(nodes=nodes)]
-    elif pad_shape == "SHAPE_CIRCLE":
-        pass
-    elif pad_shape == "SHAPE_RECT":
-        rotation = float(data[9])
+    handler.__name__ = batch_func.__name__.replace("hb_", "h_")
+    return handler
 
-    kicad_mod.append(
-        Pad(
-            number=pad_number,
-            type=pad_type,
-            shape=getattr(Pad, pad_shape),
-            at=pad_position,
-            size=pad_size,
-            rotation=rotation,
-            drill=pad_drill,
-            layers=pad_layer,
-            primitives=primitives
-        )
-    )
+
+h_TRACK = _single(hb_TRACK)
+h_PAD = _single(hb_PAD)
+h_CIRCLE = _single(hb_CIRCLE)
+h_HOLE = _single(hb_HOLE)
 
 
 def h_ARC(data, kicad_mod, footprint_info):
@@ -161,7 +368,7 @@ def h_ARC(data, kicad_mod, footprint_info):
 
         width = pmil2mm(data[0])
         sarc = path[1]
-        if not isinstance(sarc, svg_ARC):
+        if not isinstance(sarc, svg_ARC) or sarc.center is None:
             logger.warning("Footprint: Path ARC DATA ERR. %s", path)
             return
 
@@ -184,35 +391,6 @@ def h_ARC(data, kicad_mod, footprint_info):
         logger.exception("Footprint(Arc): failed to add ARC")
 
 
-def h_CIRCLE(data, kicad_mod, footprint_info):
-    # append a Circle to the footprint
-
-    # they want to draw a circle on pads, we don't want that.
-    # This is an empirical deduction, no idea if this is correct,
-    # but it seems to work on my tests
-    if data[4] == "100":
-        return
-
-    center = mil2mm(data[0], data[1], footprint_info)
-    radius = pmil2mm(data[2])
-    width = pmil2mm(data[3])
-
-    try:
-        layer = layer_correspondance[data[4]]
-    except KeyError:
-        logger.exception('Footprint(Circle): footprint layer correspondance not found')
-        layer = "F.SilkS"
-
-    kicad_mod.append(
-        Circle(
-            center=center,
-            radius=radius,
-            width=width,
-            layer=layer
-        )
-    )
-
-
 def h_RECT(data, kicad_mod, footprint_info):
     # append a Circle to the footprint
 
@@ -256,20 +434,6 @@ def h_SVGNODE(data, kicad_mod, footprint_info):
     return model_data
 
 
-def h_HOLE(data, kicad_mod, footprint_info):
-    hole_size = pmil2mm(float(data[2]) * 2)     # R -> Dia
-    kicad_mod.append(
-        Pad(
-            type=Pad.TYPE_NPTH,
-            shape=Pad.SHAPE_CIRCLE,
-            layers=Pad.LAYERS_NPTH,
-            at=mil2mm(data[0], data[1], footprint_info),
-            size=(hole_size, hole_size),
-            drill=hole_size,
-        )
-    )
-
-
 def h_VIA(data, kicad_mod, footprint_info):
     logger.warning("Footprint: VIA not supported.")
     logger.info("      Via are often added for better heat dissipation.")
@@ -287,3 +451,10 @@ FOOTPRINT_HANDLER = {
     "VIA": h_VIA,
     "HOLE": h_HOLE,
 }
+
+FOOTPRINT_BATCH_HANDLER = {
+    "TRACK": hb_TRACK,
+    "PAD": hb_PAD,
+    "CIRCLE": hb_CIRCLE,
+    "HOLE": hb_HOLE,
+}
@@ -1,16 +1,55 @@
+import hashlib
+import json
 import logging
+import os
+import tempfile
 
 from pathlib import Path
 from KicadModTree import KicadFileHandler
 
+from .memo import SerializedFootprint
+
 
 logger = logging.getLogger("KICONV")
 
 
+# model store index, kept in the .3dshapes directory.
+MODEL_INDEX_NAME = ".models.json"
+MODEL_INDEX_VERSION = 1
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
 class FootprintExist(Exception):
     pass
 
 
+def _file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while True:
+            chunk = fp.read(HASH_BUFFER_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def _atomic_write_text(path, text):
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(text)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
 class FootprintManager:
 
     def __init__(self, root_path, lib_name='lcsc', lib_prefix='libs'):
@@ -18,6 +57,10 @@ class FootprintManager:
         self.lib_prefix = lib_prefix
         self.lib_path = Path(root_path).joinpath(f"{lib_name}.pretty")
         self.lib_3d_path = Path(root_path).joinpath(f"{lib_name}.3dshapes")
+        self.model_index_path = self.lib_3d_path.joinpath(MODEL_INDEX_NAME)
+        # model key (uuid...) -> name, sha256 -> name
+        self._model_keys = None
+        self._model_hashes = None
 
         self.post_init_check()
 
@@ -35,15 +78,190 @@ class FootprintManager:
         if self.check_footprint(name) and not update:
             raise FootprintExist()
 
-        file_handler = KicadFileHandler(data)
-        file_handler.writeFile(str(footprint_path))
+        if isinstance(data, SerializedFootprint):
+            footprint_path.write_text(data.serialize())
+        else:
+            file_handler = KicadFileHandler(data)
+            file_handler.writeFile(str(footprint_path))
         # file_handler.writeFile(f'{output_dir}/{footprint_lib}/{footprint_name}.kicad_mod')
         logger.info("Footprint Manager: Footprint add to %s", str(footprint_path))
 
+    def load_model_index(self):
+        if self._model_keys is not None:
+            return
+
+        self._model_keys = {}
+        self._model_hashes = {}
+        try:
+            index = json.loads(self.model_index_path.read_text())
+        except (OSError, ValueError):
+            return
+
+        if index.get('version') != MODEL_INDEX_VERSION:
+            return
+
+        self._model_keys = index.get('keys', {})
+        self._model_hashes = index.get('hashes', {})
+
+    def save_model_index(self):
+        index = {
+            'version': MODEL_INDEX_VERSION,
+            'keys': self._model_keys,
+            'hashes': self._model_hashes,
+        }
+        try:
+            _atomic_write_text(self.model_index_path, json.dumps(index, indent=1))
+        except OSError:
+            logger.warning(
+                "Footprint Manager: Unable to write model index %s.",
+                self.model_index_path
+            )
+
+    def find_3d_model(self, data):
+        """
+        Name of a stored model converted from the same source as `data`
+        (WRLModel), None if there is none.
+        """
+        key = getattr(data, 'key', None)
+        if key is None:
+            return None
+
+        self.load_model_index()
+        name = self._model_keys.get(key)
+        if name is None or not self.check_3d_model(name):
+            return None
+
+        return name
+
     def add_3d_model(self, name, data, update=False):
+        """
+        Store a 3D model and return the name to reference it with
+        (get_3d_model_ref_path).
+
+        Models are deduplicated: a WRLModel already converted for the same
+        uuid is not downloaded again, and a model with the same content as
+        a stored one is not written twice, the stored name is returned.
+        """
+        stored = self.find_3d_model(data)
+        if stored is not None:
+            logger.info(
+                "Footprint Manager: 3D Model %s reused for %s.", stored, name
+            )
+            return stored
+
+        self.load_model_index()
         model_path = self.lib_3d_path.joinpath(f"{name}.wrl")
-        model_path.write_text(data)
-        logger.info("Footprint Manager: 3D Model add to %s", str(model_path))
+
+        # WRLModel are streamed into a temp file then renamed, a failed
+        # conversion does not leave a truncated model behind.
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self.lib_3d_path, prefix=f".{name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                if isinstance(data, str):
+                    fp.write(data)
+                else:
+                    data.write_to(fp)
+
+            digest = _file_digest(tmp_name)
+            stored = self._model_hashes.get(digest)
+            if stored is not None and self.check_3d_model(stored):
+                os.unlink(tmp_name)
+                logger.info(
+                    "Footprint Manager: 3D Model %s same as %s, reused.",
+                    name,
+                    stored
+                )
+            else:
+                os.replace(tmp_name, model_path)
+                stored = name
+                self._drop_model_name(name)
+                self._model_hashes[digest] = name
+                logger.info("Footprint Manager: 3D Model add to %s", str(model_path))
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+        key = getattr(data, 'key', None)
+        if key is not None:
+            self._model_keys[key] = stored
+        self.save_model_index()
+
+        return stored
+
+    def _drop_model_name(self, name):
+        # `name` is overwritten, forget what pointed to the old content.
+        self._model_hashes = {
+            k: v for k, v in self._model_hashes.items() if v != name
+        }
+        self._model_keys = {
+            k: v for k, v in self._model_keys.items() if v != name
+        }
+
+    def dedup_3d_models(self, dry_run=False):
+        """
+        Deduplicate the .3dshapes directory of an existing library.
+
+        Models with the same content are merged into one (the one already
+        in the model store, else the first name in sort order), footprints
+        referencing a removed model are rewritten to reference the kept one.
+
+        Returns ({kept: [removed, ...]}, [rewritten footprint names]).
+        """
+        self.load_model_index()
+
+        by_digest = {}
+        for path in sorted(self.lib_3d_path.glob("*.wrl")):
+            by_digest.setdefault(_file_digest(path), []).append(path.stem)
+
+        duplicates = {}
+        rename = {}
+        stored = set(self._model_hashes.values())
+        for names in by_digest.values():
+            names.sort(key=lambda x: (x not in stored, x))
+            if len(names) > 1:
+                duplicates[names[0]] = names[1:]
+                for name in names[1:]:
+                    rename[name] = names[0]
+
+        rewritten = []
+        shapes_dir = f"{self.lib_name}.3dshapes/"
+        for path in sorted(self.lib_path.glob("*.kicad_mod")):
+            text = path.read_text()
+            new_text = text
+            for old, new in rename.items():
+                new_text = new_text.replace(
+                    f"{shapes_dir}{old}.wrl", f"{shapes_dir}{new}.wrl"
+                )
+            if new_text != text:
+                rewritten.append(path.stem)
+                if not dry_run:
+                    _atomic_write_text(path, new_text)
+
+        if dry_run:
+            return duplicates, rewritten
+
+        for old in rename:
+            self.lib_3d_path.joinpath(f"{old}.wrl").unlink()
+
+        self._model_hashes = {
+            digest: names[0] for digest, names in by_digest.items()
+        }
+        self._model_keys = {
+            k: rename.get(v, v)
+            for k, v in self._model_keys.items()
+            if self.check_3d_model(rename.get(v, v))
+        }
+        self.save_model_index()
+
+        logger.info(
+            "Footprint Manager: %s duplicated 3D models removed, %s footprints updated.",
+            len(rename),
+            len(rewritten)
+        )
+        return duplicates, rewritten
 
     def check_footprint(self, name):
         footprint_path = self.lib_path.joinpath(f"{name}.kicad_mod")
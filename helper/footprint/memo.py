@@ -0,0 +1,134 @@
+import logging
+import threading
+
+from collections import OrderedDict
+
+from KicadModTree import Footprint, KicadFileHandler, Model
+from KicadModTree.util.kicad_util import lispString, formatTimestamp
+
+
+logger = logging.getLogger("KICONV")
+
+
+# bump when create_footprint output changes, memo entries of an older
+# converter are not reused.
+CONVERTER_VERSION = 1
+
+MEMO_SIZE = 256
+
+# placeholders in the serialized template, no space / quote so they are
+# written unquoted by the serializer.
+NAME_TOKEN = "__KLPM_FOOTPRINT_NAME__"
+DESCR_TOKEN = "__KLPM_FOOTPRINT_DESCR__"
+TEDIT_TOKEN = "(tedit 0)"
+
+
+class FootprintTemplate:
+    """
+    Serialized .kicad_mod of a converted package, with the footprint name
+    and description left as placeholders.
+    """
+
+    def __init__(self, kicad_mod):
+        kicad_mod.setDescription(DESCR_TOKEN)
+        self.body = KicadFileHandler(kicad_mod).serialize(timestamp=0)
+        self.c_3d_model = kicad_mod.c_3d_model
+        self.c_3d_model_rotation = kicad_mod.c_3d_model_rotation
+
+    def instantiate(self, name, description=None):
+        return SerializedFootprint(self, name, description)
+
+
+class SerializedFootprint:
+    """
+    A footprint built from a FootprintTemplate. Acts like the Footprint
+    returned by create_footprint for what the library writers use:
+    setDescription(), append(Model(...)), c_3d_model and
+    c_3d_model_rotation. Written by FootprintManager.add_footprint.
+    """
+
+    def __init__(self, template, name, description=None):
+        self.template = template
+        self.name = name
+        self.description = description
+        self.models = []
+        self.c_3d_model = template.c_3d_model
+        rotation = template.c_3d_model_rotation
+        self.c_3d_model_rotation = list(rotation) if rotation is not None else None
+
+    def setDescription(self, description):
+        self.description = description
+
+    def append(self, node):
+        if not isinstance(node, Model):
+            raise TypeError("Only Model can be added to a serialized footprint.")
+        self.models.append(node)
+
+    def _serialize_models(self):
+        # serialize the models in an empty footprint and keep their lines,
+        # they go at the end of the footprint, like KicadFileHandler does.
+        kicad_mod = Footprint(NAME_TOKEN)
+        for node in self.models:
+            kicad_mod.append(node)
+
+        lines = KicadFileHandler(kicad_mod).serialize(timestamp=0).splitlines()
+        return "\n".join(lines[1:-1]) + "\n"
+
+    def serialize(self, timestamp=None):
+        text = self.template.body
+        text = text.replace(TEDIT_TOKEN, f"(tedit {formatTimestamp(timestamp)})", 1)
+        text = text.replace(NAME_TOKEN, lispString(self.name))
+        text = text.replace(DESCR_TOKEN, lispString(self.description or ""))
+
+        if self.models:
+            end = text.rstrip().rfind(")")
+            text = text[:end] + self._serialize_models() + text[end:]
+
+        return text
+
+
+class FootprintMemo:
+    """
+    LRU of converted packages, keyed by (footprint uuid, updateTime,
+    converter version, options). Many LCSC parts share one EasyEDA
+    package, it is converted once and only the name is patched.
+    """
+
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        Template for `key`, `create()` builds the footprint (with NAME_TOKEN
+        as name) when there is none.
+        """
+        key = (CONVERTER_VERSION,) + tuple(key)
+
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                logger.debug("Footprint: memo hit %s", key)
+                return template
+
+        template = FootprintTemplate(create())
+
+        with self._lock:
+            self._entries[key] = template
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_memo = FootprintMemo()
+
+
+def get_footprint_memo():
+    return _memo
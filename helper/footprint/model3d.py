@@ -1,131 +1,402 @@
-import requests
+import abc
+import io
 import logging
-import os
+import re
+import shutil
+import tempfile
+import threading
 
-from KicadModTree import *
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import groupby
+
+import numpy as np
+
+from ..network import get_cache, stream_3d_model
+from .numeric import round_array
 
 
 logger = logging.getLogger("KICONV")
 
 
-def get_3Dmodel(
-    component_uuid, footprint_info, kicad_mod, translationZ, rotation
-):
-    logger.info("3DModel: creating 3D model ...")
-
-    lines = requests.get(f"https://easyeda.com/analyzer/api/3dmodel/{component_uuid}").content.decode().split("\n")
-
-    vertices = []
-    faces = []
-    color_change = []
-    vertices_counter = 0
-    last_change = 0
-    translationX, translationY, translationZ = 0, 0, float(translationZ)/3.048 # foot to mm 
-
-    for line in lines :
-        if len(line) > 0 and line[0] == "v":
-            _,  x, y, z = line.split(" ")
-            # TODO
-            vertices.append(' '.join([str(round(float(x)/2.54,4)), str(round(float(y)/2.54,4)), str(round(float(z)/2.54,4))]))
-            vertices_counter += 1
-        elif len(line) > 0 and line[0] == "f":
-            _, x, y, z = line.split(" ")
-            faces.append(', '.join([str(int(x[:-2])-1), str(int(y[:-2])-1), str(int(z[:-2])-1), "-1"]))
-        elif len(line) > 0 and line[0:2] == "Kd":
-            _, r, g, b = line.split(" ")
-            color_change.append([vertices_counter - last_change,  str(1-float(r)), str(1-float(g)), str(1-float(b))])
-            last_change = vertices_counter
-        elif len(line) > 0 and line[0:2] == "Ka":
-            pass
-        elif len(line) > 0 and line[0:2] == "Ks":
-            pass
-        elif len(line) > 0 and line[0:1] == "d":
-            pass
-        elif (
-            len(line) > 0
-            and line[0:6] == "newmtl"
-            or line[0:6] == "endmtl"
-            or line[0:6] == "usemtl"
-        ):
-            pass
-        elif len(line) == 0:
-            pass
-        else:
-            logger.warning("3DModel: 3D model handler not supported")
-            logger.debug("3DModel: %s", line)
+# bump when the generated VRML changes, models converted by an older
+# version are not reused from the model store.
+CONVERTER_VERSION = 2
+
+# background model downloads.
+DOWNLOAD_WORKERS = 4
+
+# OBJ records parsed / formatted at once.
+BATCH_SIZE = 64 * 1024
 
-    wrl_header = f"""#VRML V2.0 utf8
+FACE_REF_RE = re.compile(r"/[^\s]*")
+
+WRL_HEADER = """#VRML V2.0 utf8
 # This file is automatically generated.
 
 Group {{
     translation {translationX} {translationY} {translationZ}
     children [
-        Shape {{
+"""
+
+WRL_SHAPE_HEADER = """        Shape {{
             appearance Appearance {{
                 material Material {{
-                    diffuseColor 1.0 1.0 1.0
+                    diffuseColor {color}
                     ambientIntensity 0.2
                     specularColor 0.8 0.8 0.8
                     shininess 0.4
-                    transparency 0
+                    transparency {transparency}
                 }}
             }}
             geometry IndexedFaceSet {{
                 ccw TRUE
                 solid FALSE
-                coord DEF co Coordinate {{
+"""
+
+# the coordinates are written once, in the first shape.
+WRL_COORD_DEF_HEADER = """                coord DEF co Coordinate {
                     point [
                         """
 
-    wrl_vertices2faces = """,
+WRL_COORD_DEF_FOOTER = """
                     ]
                 }
-                coordIndex [
-                    """
+"""
 
-    wrl_faces2colors = """
-                ]
-                colorPerVertex TRUE
-                color Color {
-                    color [
+WRL_COORD_USE = """                coord USE co
 """
 
-    wrl_footer = """                ]
-                }
+WRL_FACES_HEADER = """                coordIndex [
+                    """
+
+WRL_SHAPE_FOOTER = """
+                ]
             }
         }
-    ]
+"""
+
+WRL_FOOTER = """    ]
 }"""
 
-    wrl_color_change = ""
-    for change in color_change:
-        wrl_color_change += ('' + ' '.join(change[1:]) + ",\n") * change[0]
-
-    # if not os.path.exists(f"{footprint_info.output_dir}/{footprint_info.footprint_lib}"):
-    #     os.makedirs(f"{footprint_info.output_dir}/{footprint_info.footprint_lib}")
-    # if not os.path.exists(f"{footprint_info.output_dir}/{footprint_info.footprint_lib}/packages3d"):
-    #     os.makedirs(f"{footprint_info.output_dir}/{footprint_info.footprint_lib}/packages3d")
-
-    # filename = f"{footprint_info.output_dir}/{footprint_info.footprint_lib}/packages3d/{footprint_info.footprint_name}.wrl"
-    # with open(filename, "w") as f:
-        # f.write(wrl_header)
-        # f.write(',\n'.join(vertices))
-        # f.write(wrl_vertices2faces)
-        # f.write(',\n'.join(faces))
-        # f.write(wrl_faces2colors)
-        # f.write(wrl_color_change)
-        # f.write(wrl_footer)
-    wrl_ctx = wrl_header
-    wrl_ctx += ',\n'.join(vertices)
-    wrl_ctx += wrl_vertices2faces
-    wrl_ctx += ',\n'.join(faces)
-    wrl_ctx += wrl_faces2colors
-    wrl_ctx += wrl_color_change
-    wrl_ctx += wrl_footer
 
+def iter_line_blocks(chunks):
+    """
+    Split a stream of byte chunks into lists of text lines (without the
+    newline), one list per chunk.
+    """
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk
+        end = data.rfind(b"\n") + 1
+        pending = data[end:]
+        if end:
+            yield data[:end - 1].decode().split("\n")
+
+    yield [pending.decode()]
+
+
+def _record_type(line):
+    return line[:1]
+
+
+class _BatchWriter(abc.ABC):
+    """
+    Collect OBJ records and write them in batches of BATCH_SIZE, parsed and
+    formatted with NumPy. Rows are separated by ",\n" like a joined list.
+    """
+
+    # set by the subclasses.
+    row_format = ""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.count = 0
+        self._lines = []
+
+    def extend(self, lines):
+        self._lines.extend(lines)
+        self.count += len(lines)
+        if len(self._lines) >= BATCH_SIZE:
+            self.flush()
+
+    @abc.abstractmethod
+    def parse(self, text):
+        """Records `text` (joined by spaces) as a (n, 3) array."""
+
+    def flush(self):
+        if not self._lines:
+            return
+
+        first = self.count == len(self._lines)
+        rows = self.parse(" ".join(self._lines))
+        if rows.shape[0] != len(self._lines):
+            raise ValueError("3DModel: malformed OBJ record")
+        self._lines = []
+
+        if not first:
+            self.fp.write(",\n")
+        # one formatting call for the whole batch, np.savetxt style.
+        fmt = ",\n".join([self.row_format] * rows.shape[0])
+        self.fp.write(fmt % tuple(rows.ravel().tolist()))
+
+    def copy_to(self, fp):
+        self.fp.seek(0)
+        shutil.copyfileobj(self.fp, fp)
+
+
+class VertexWriter(_BatchWriter):
+    row_format = "%.10g %.10g %.10g"
+
+    def parse(self, text):
+        values = text.split()
+        # drop the record type, "v x y z".
+        del values[::4]
+        data = np.array(values, dtype=np.float64).reshape(-1, 3)
+        # mm -> 0.1 inch, the unit of KiCad VRML models.
+        return round_array(data / 2.54, 4)
+
+
+class FaceWriter(_BatchWriter):
+    row_format = "%d, %d, %d, -1"
+
+    def parse(self, text):
+        # "f 1// 2// 3//", "f 1//1 ..." or "f 1/1/1 ...", only keep the
+        # vertex index, everything from the first "/" is dropped.
+        text = FACE_REF_RE.sub("", text)
+        values = text.split()
+        del values[::4]
+        return np.array(values, dtype=np.int64).reshape(-1, 3) - 1
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# uuid -> future of the downloads in flight, one download per model.
+_downloads = {}
+
+
+def get_download_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DOWNLOAD_WORKERS,
+                thread_name_prefix="3dmodel"
+            )
+
+    return _executor
+
+
+def submit_download(uuid, prefetch):
+    """
+    Run prefetch() on the download executor, unless a download of `uuid`
+    is already in flight, its future is returned then.
+    """
+    executor = get_download_executor()
+    with _executor_lock:
+        future = _downloads.get(uuid)
+        if future is not None:
+            return future
+
+        future = executor.submit(prefetch)
+        _downloads[uuid] = future
+
+    # may run right away, outside of the lock.
+    future.add_done_callback(lambda _: _done_download(uuid, future))
+    return future
+
+
+def _done_download(uuid, future):
+    with _executor_lock:
+        if _downloads.get(uuid) is future:
+            del _downloads[uuid]
+
+
+class Material:
+
+    def __init__(self, name, color="1.0 1.0 1.0", transparency=0):
+        self.name = name
+        self.color = color
+        self.transparency = transparency
+        self.faces = None
+
+
+class WRLModel:
+    """
+    VRML model of a footprint, converted from the EasyEDA OBJ model when it
+    is written.
+
+    The OBJ is streamed from the cache (or the network), vertices and the
+    faces of each material are spooled to temp files and the VRML is
+    assembled from them, memory does not grow with the model size.
+
+    Each material is one Shape with its own color, the coordinates are
+    defined once and shared with USE.
+    """
+
+    def __init__(self, component_uuid, translationZ):
+        self.uuid = component_uuid
+        # foot to mm
+        self.translation = (0, 0, float(translationZ) / 3.048)
+        self._future = None
+
+    def __repr__(self):
+        return f"WRLModel({self.uuid})"
+
+    def __getstate__(self):
+        # futures do not cross process boundaries.
+        state = self.__dict__.copy()
+        state['_future'] = None
+        return state
+
+    @property
+    def key(self):
+        """
+        Identify the converted model, the same uuid with the same
+        translation gives the same VRML.
+        """
+        return f"{self.uuid}:{self.translation[2]!r}:{CONVERTER_VERSION}"
+
+    def prefetch(self):
+        """
+        Download the OBJ into the cache, so write_to() does not need the
+        network. Useful to download from worker threads.
+        """
+        if not get_cache().enabled:
+            return
+
+        for _ in stream_3d_model(self.uuid):
+            pass
+
+    def start_download(self):
+        """
+        Prefetch in the background, returns the future. write_to() waits
+        for it instead of starting a second download.
+        """
+        if self._future is None and get_cache().enabled:
+            self._future = submit_download(self.uuid, self.prefetch)
+
+        return self._future
+
+    def wait(self):
+        if self._future is None:
+            return
+
+        try:
+            self._future.result()
+        except Exception:
+            # write_to() tries again and reports the error.
+            logger.warning("3DModel: background download of %s failed.", self.uuid)
+
+    def write_to(self, fp):
+        """
+        Write the VRML to the text file `fp`.
+        """
+        logger.info("3DModel: creating 3D model ...")
+        self.wait()
+
+        with ExitStack() as stack:
+            def spool():
+                return stack.enter_context(tempfile.TemporaryFile('w+'))
+
+            vertices = VertexWriter(spool())
+            # faces without usemtl.
+            default = Material(None)
+            materials = {}
+            current = default
+            material = None
+
+            for lines in iter_line_blocks(stream_3d_model(self.uuid)):
+                # runs of v / f records are handed over as a whole.
+                for record, run in groupby(lines, _record_type):
+                    if record == "v":
+                        vertices.extend(list(run))
+                        continue
+                    if record == "f":
+                        if current.faces is None:
+                            current.faces = FaceWriter(spool())
+                        current.faces.extend(list(run))
+                        continue
+
+                    for line in run:
+                        if line[:6] == "newmtl":
+                            material = Material(line[7:].strip())
+                            materials[material.name] = material
+                        elif line[:6] == "usemtl":
+                            name = line[7:].strip()
+                            current = materials.get(name)
+                            if current is None:
+                                logger.warning("3DModel: material %s not defined", name)
+                                current = materials[name] = Material(name)
+                        elif line[:2] == "Kd" and material is not None:
+                            material.color = " ".join(line.split()[1:4])
+                        elif line[:2] == "d " and material is not None:
+                            # EasyEDA writes the transparency here (d 0 is
+                            # opaque), not the OBJ dissolve.
+                            material.transparency = float(line.split()[1])
+                        elif line[:2] in ("Ka", "Ks") or line[:6] == "endmtl":
+                            pass
+                        elif line:
+                            logger.warning("3DModel: 3D model handler not supported")
+                            logger.debug("3DModel: %s", line)
+
+            vertices.flush()
+            shapes = [default] + list(materials.values())
+            shapes = [x for x in shapes if x.faces is not None]
+            if not shapes:
+                shapes = [default]
+
+            translationX, translationY, translationZ = self.translation
+            fp.write(WRL_HEADER.format(
+                translationX=translationX,
+                translationY=translationY,
+                translationZ=translationZ
+            ))
+
+            for i, shape in enumerate(shapes):
+                fp.write(WRL_SHAPE_HEADER.format(
+                    color=shape.color,
+                    transparency=shape.transparency
+                ))
+                if i == 0:
+                    fp.write(WRL_COORD_DEF_HEADER)
+                    vertices.copy_to(fp)
+                    fp.write(WRL_COORD_DEF_FOOTER)
+                else:
+                    fp.write(WRL_COORD_USE)
+
+                fp.write(WRL_FACES_HEADER)
+                if shape.faces is not None:
+                    shape.faces.flush()
+                    shape.faces.copy_to(fp)
+                fp.write(WRL_SHAPE_FOOTER)
+
+            fp.write(WRL_FOOTER)
+
+        logger.info(
+            "3DModal: 3DModel Generated. %s vertices, %s materials.",
+            vertices.count,
+            len(shapes)
+        )
+
+    def to_string(self):
+        buf = io.StringIO()
+        self.write_to(buf)
+        return buf.getvalue()
+
+
+def get_3Dmodel(
+    component_uuid, footprint_info, kicad_mod, translationZ, rotation
+):
+    """
+    Returns (WRLModel, rotate). The model download starts in the
+    background, it is converted when written to the library
+    (FootprintManager.add_3d_model).
+    """
     rotate = [-float(axis_rotation) for axis_rotation in rotation.split(',')]
 
     # kicad_mod.append(Model(filename = f"{os.path.dirname(__file__)}\{filename}", rotate = [-float(axis_rotation) for axis_rotation in rotation.split(',')]))
-    logger.info("3DModal: 3DModel Generated. Size: %s", len(wrl_ctx))
-
-    return wrl_ctx, rotate
\ No newline at end of file
+    model = WRLModel(component_uuid, translationZ)
+    model.start_download()
+    return model, rotate
@@ -0,0 +1,18 @@
+import numpy as np
+
+
+def round_array(values, ndigits=2):
+    """
+    np.round does rint(x * 10**n) / 10**n, which can differ from python
+    round() when x is (almost) on a .5 tie. Values close to a tie are
+    rounded again with round() so the result matches the scalar helpers.
+    """
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    result = np.rint(scaled) / scale
+
+    tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if tie.any():
+        result[tie] = [round(x, ndigits) for x in values[tie].tolist()]
+
+    return result
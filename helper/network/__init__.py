@@ -0,0 +1,6 @@
+from .client import get_session, configure_session, http_get, http_post
+from .cache import ResponseCache, get_cache, configure_cache, user_cache_dir
+from .cache import CacheWriter
+from .easyeda import fetch_product_detail, fetch_product_svgs
+from .easyeda import fetch_product_components, fetch_component
+from .easyeda import stream_fetch, stream_3d_model
@@ -0,0 +1,418 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+
+logger = logging.getLogger("NETWORK")
+
+
+APP_NAME = "KLPM"
+CACHE_ENV = "KLPM_CACHE_DIR"
+
+# the least recently used payloads are dropped above this size.
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+# a prune brings the cache down to this share of max_size.
+PRUNE_TARGET = 0.8
+# seconds between automatic prunes.
+PRUNE_INTERVAL = 24 * 60 * 60
+# files younger than this are never swept, a writer may still use them.
+PRUNE_GRACE = 60 * 60
+# an object read is marked used (mtime) at most this often.
+TOUCH_INTERVAL = 60 * 60
+PRUNE_STAMP = ".last_prune"
+
+
+def user_cache_dir(app_name=APP_NAME):
+    if os.environ.get(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV])
+
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or Path.home().joinpath(
+            "AppData", "Local")
+        return Path(base).joinpath(app_name, "Cache")
+
+    if sys.platform == 'darwin':
+        return Path.home().joinpath("Library", "Caches", app_name)
+
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home().joinpath(".cache")
+    return Path(base).joinpath(app_name)
+
+
+def _atomic_write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class CacheEntry:
+
+    def __init__(self, digest, update_time=None, stored_at=0, path=None):
+        self.digest = digest
+        self.update_time = update_time
+        self.stored_at = stored_at
+        self.path = path
+
+    def age(self):
+        return time.time() - self.stored_at
+
+    def is_fresh(self, update_time=None, ttl=None):
+        """
+        An entry is fresh when it was stored for the expected updateTime,
+        or (no updateTime to check against) when it is younger than `ttl`.
+        No updateTime and no ttl means the entry never expires.
+        """
+        if update_time is not None:
+            return self.update_time == update_time
+
+        if ttl is not None:
+            return self.age() < ttl
+
+        return True
+
+    def read(self):
+        return self.path.read_bytes()
+
+    def open(self):
+        return self.path.open('rb')
+
+
+class CacheWriter:
+    """
+    Store a payload in the cache chunk by chunk, for bodies that should
+    not be held in memory. Nothing is visible in the cache before commit().
+    """
+
+    def __init__(self, cache, namespace, key, update_time=None):
+        self.cache = cache
+        self.namespace = namespace
+        self.key = key
+        self.update_time = update_time
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._fp = None
+        self._tmp = None
+
+        if not cache.enabled:
+            return
+
+        try:
+            objects = cache.root.joinpath("objects")
+            objects.mkdir(parents=True, exist_ok=True)
+            fd, self._tmp = tempfile.mkstemp(dir=objects, prefix=".tmp-")
+            self._fp = os.fdopen(fd, 'wb')
+        except OSError:
+            logger.warning(
+                "Cache: unable to store %s/%s in %s", namespace, key, cache.root
+            )
+            self._tmp = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self._fp is None:
+            return
+
+        self._hasher.update(chunk)
+        try:
+            self._fp.write(chunk)
+        except OSError:
+            logger.warning("Cache: unable to write %s/%s", self.namespace, self.key)
+            self.abort()
+
+    def abort(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        if self._tmp is not None:
+            if os.path.exists(self._tmp):
+                os.unlink(self._tmp)
+            self._tmp = None
+
+    def commit(self):
+        if self._fp is None:
+            return None
+
+        self._fp.close()
+        self._fp = None
+        digest = self._hasher.hexdigest()
+        path = self.cache._object_path(digest)
+
+        try:
+            with self.cache._lock:
+                if path.exists():
+                    os.unlink(self._tmp)
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(self._tmp, path)
+                self._tmp = None
+                self.cache._write_ref(
+                    self.namespace, self.key, digest, self.update_time
+                )
+        except OSError:
+            logger.warning(
+                "Cache: unable to store %s/%s in %s",
+                self.namespace,
+                self.key,
+                self.cache.root
+            )
+            self.abort()
+            return None
+
+        return digest
+
+
+class ResponseCache:
+    """
+    Content addressed on-disk cache.
+
+    Payloads are stored once under `objects/` by their sha256, a small json
+    ref under `refs/<namespace>/` maps a request key (lcid, uuid...) to the
+    payload digest together with the EasyEDA updateTime and store time.
+
+    The mtime of an object is its last use. prune() sweeps orphans and
+    drops the least recently used objects above `max_size`.
+    """
+
+    def __init__(self, root=None, enabled=True, max_size=DEFAULT_MAX_SIZE):
+        self.root = Path(root) if root is not None else user_cache_dir()
+        self.enabled = enabled
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _ref_path(self, namespace, key):
+        name = hashlib.sha1(str(key).encode()).hexdigest()
+        return self.root.joinpath("refs", namespace, f"{name}.json")
+
+    def _object_path(self, digest):
+        return self.root.joinpath("objects", digest[:2], digest)
+
+    def lookup(self, namespace, key):
+        if not self.enabled:
+            return None
+
+        ref_path = self._ref_path(namespace, key)
+        try:
+            ref = json.loads(ref_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        path = self._object_path(ref['digest'])
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        return CacheEntry(
+            ref['digest'],
+            update_time=ref.get('update_time'),
+            stored_at=ref.get('stored_at', 0),
+            path=path
+        )
+
+    def get(self, namespace, key, update_time=None, ttl=None):
+        entry = self.lookup(namespace, key)
+        if entry is None or not entry.is_fresh(update_time, ttl):
+            return None
+
+        return entry.read()
+
+    def _write_ref(self, namespace, key, digest, update_time=None):
+        ref = {
+            'key': str(key),
+            'digest': digest,
+            'update_time': update_time,
+            'stored_at': time.time(),
+        }
+        _atomic_write(
+            self._ref_path(namespace, key),
+            json.dumps(ref).encode()
+        )
+
+    def writer(self, namespace, key, update_time=None):
+        return CacheWriter(self, namespace, key, update_time)
+
+    def put(self, namespace, key, payload, update_time=None):
+        if not self.enabled:
+            return None
+
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+
+        try:
+            with self._lock:
+                if not path.exists():
+                    _atomic_write(path, payload)
+
+                self._write_ref(namespace, key, digest, update_time)
+        except OSError:
+            logger.warning(
+                "Cache: unable to store %s/%s in %s", namespace, key, self.root
+            )
+            return None
+
+        return digest
+
+    def _refs(self):
+        # (ref path, digest or None)
+        for path in self.root.joinpath("refs").glob("*/*.json"):
+            try:
+                digest = json.loads(path.read_text())['digest']
+            except (OSError, ValueError, KeyError, TypeError):
+                digest = None
+            yield path, digest
+
+    def _objects(self):
+        # (path, stat), temp files included.
+        for path in self.root.joinpath("objects").glob("*/*"):
+            try:
+                yield path, path.stat()
+            except OSError:
+                pass
+        for path in self.root.joinpath("objects").glob(".tmp-*"):
+            try:
+                yield path, path.stat()
+            except OSError:
+                pass
+
+    def prune(self, max_size=None):
+        """
+        Remove orphaned objects (no ref points to them), refs without
+        object and left over temp files, then the least recently used
+        objects until the cache is under PRUNE_TARGET of `max_size`.
+
+        Returns (removed files, freed bytes).
+        """
+        if max_size is None:
+            max_size = self.max_size
+
+        removed = 0
+        freed = 0
+        now = time.time()
+
+        def unlink(path, size=0):
+            nonlocal removed, freed
+            try:
+                path.unlink()
+            except OSError:
+                return
+            removed += 1
+            freed += size
+
+        with self._lock:
+            refs = {}
+            for path, digest in self._refs():
+                refs.setdefault(digest, []).append(path)
+
+            objects = []
+            for path, stat in self._objects():
+                young = now - stat.st_mtime < PRUNE_GRACE
+                if path.name.startswith(".tmp-") or path.name not in refs:
+                    if not young:
+                        unlink(path, stat.st_size)
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, path))
+
+            stored = {path.name for _, _, path in objects}
+            for digest, paths in refs.items():
+                if digest in stored:
+                    continue
+                for path in paths:
+                    try:
+                        young = now - path.stat().st_mtime < PRUNE_GRACE
+                    except OSError:
+                        continue
+                    if not young:
+                        unlink(path)
+
+            size = sum(x[1] for x in objects)
+            if max_size is not None and size > max_size:
+                target = max_size * PRUNE_TARGET
+                for _, obj_size, path in sorted(objects):
+                    if size <= target:
+                        break
+                    unlink(path, obj_size)
+                    size -= obj_size
+                    for ref_path in refs.get(path.name, []):
+                        unlink(ref_path)
+
+        logger.info(
+            "Cache: pruned %s files, %.1f MB freed, %.1f MB in use.",
+            removed,
+            freed / 1024 / 1024,
+            size / 1024 / 1024
+        )
+        return removed, freed
+
+    def maybe_prune(self):
+        """
+        Prune in a background thread, at most once per PRUNE_INTERVAL.
+        """
+        if not self.enabled:
+            return
+
+        stamp = self.root.joinpath(PRUNE_STAMP)
+        try:
+            if time.time() - stamp.stat().st_mtime < PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            stamp.touch()
+        except OSError:
+            return
+
+        def run():
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Cache: prune failed.")
+
+        threading.Thread(target=run, name="cache-prune", daemon=True).start()
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            for name in ("refs", "objects"):
+                shutil.rmtree(self.root.joinpath(name), ignore_errors=True)
+
+        logger.info("Cache: %s cleared.", self.root)
+
+
+_cache = None
+
+
+def configure_cache(root=None, enabled=True, max_size=DEFAULT_MAX_SIZE):
+    global _cache
+    _cache = ResponseCache(root, enabled, max_size)
+    _cache.maybe_prune()
+
+
+def get_cache():
+    global _cache
+
+    if _cache is None:
+        _cache = ResponseCache()
+        _cache.maybe_prune()
+
+    return _cache
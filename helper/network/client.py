@@ -0,0 +1,99 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger("NETWORK")
+
+
+# concurrent requests of the GUI: part loading (4), preview rendering (2),
+# 3D model downloads (4) and adv. search (2) workers.
+DEFAULT_POOL_SIZE = 12
+DEFAULT_POOL_HOSTS = 4
+# (connect, read) in seconds.
+DEFAULT_TIMEOUT = (5, 30)
+
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'User-Agent': 'easyEda2Kicad',
+}
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with keep-alive pools and a default timeout.
+
+    Each host (easyeda.com, lceda.cn, wmsc.lcsc.com, image cdn...) gets its
+    own connection pool from the mounted adapter, so repeated calls reuse the
+    TCP/TLS connection instead of doing a new handshake every time.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        requests.Session.__init__(self)
+        self.timeout = timeout
+        self.headers.update(DEFAULT_HEADERS)
+
+        adapter = HTTPAdapter(
+            pool_connections=DEFAULT_POOL_HOSTS,
+            pool_maxsize=pool_size,
+            pool_block=False
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+_session = None
+_session_conf = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'timeout': DEFAULT_TIMEOUT,
+}
+_session_lock = threading.Lock()
+
+
+def configure_session(pool_size=None, timeout=None):
+    """
+    Change the pool size / default timeout of the shared session.
+
+    The current session (if any) is closed, the next call builds a new one.
+    """
+    global _session
+
+    with _session_lock:
+        if pool_size is not None:
+            _session_conf['pool_size'] = pool_size
+        if timeout is not None:
+            _session_conf['timeout'] = timeout
+
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                logger.debug(
+                    "HTTP: create pooled session. pool size: %s, timeout: %s",
+                    _session_conf['pool_size'],
+                    _session_conf['timeout']
+                )
+                _session = PooledSession(**_session_conf)
+
+    return _session
+
+
+def http_get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return get_session().post(url, **kwargs)
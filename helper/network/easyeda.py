@@ -0,0 +1,210 @@
+import json
+import logging
+
+import requests
+
+from .cache import get_cache
+from .client import http_get
+
+
+logger = logging.getLogger("NETWORK")
+
+
+EASYEDA_API = "https://easyeda.com"
+LCEDA_API = "https://lceda.cn"
+LCSC_API = "https://wmsc.lcsc.com"
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# wmsc has no updateTime, price / stock changes often.
+PRODUCT_DETAIL_TTL = 1 * DAY
+# used when the caller does not know which updateTime to expect.
+PRODUCT_TTL = 1 * DAY
+COMPONENT_TTL = 7 * DAY
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _json_update_time(payload):
+    try:
+        return json.loads(payload)['result'].get('updateTime')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _json_ok(payload):
+    try:
+        return json.loads(payload).get('code') == 0
+    except (ValueError, AttributeError):
+        return False
+
+
+def _json_has_result(payload):
+    try:
+        return bool(json.loads(payload).get('result'))
+    except (ValueError, AttributeError):
+        return False
+
+
+def cached_fetch(
+    namespace,
+    key,
+    url,
+    update_time=None,
+    ttl=None,
+    validate=None,
+    get_update_time=None
+):
+    """
+    Return the response body of `url`, served from the disk cache when the
+    cached entry is still fresh.
+
+    On network errors a stale entry is returned, so a part that was loaded
+    once keeps working offline.
+    """
+    cache = get_cache()
+    entry = cache.lookup(namespace, key)
+
+    if entry is not None and entry.is_fresh(update_time, ttl):
+        logger.debug("Cache: hit %s/%s", namespace, key)
+        return entry.read()
+
+    try:
+        req = http_get(url)
+        req.raise_for_status()
+    except requests.RequestException:
+        if entry is None:
+            raise
+        logger.warning(
+            "Cache: network error, use cached %s/%s (age %ds).",
+            namespace,
+            key,
+            entry.age()
+        )
+        return entry.read()
+
+    payload = req.content
+    if validate is None or validate(payload):
+        # prefer the updateTime the server returned over the expected one.
+        if get_update_time is not None:
+            update_time = get_update_time(payload) or update_time
+        cache.put(namespace, key, payload, update_time)
+
+    return payload
+
+
+def _iter_entry(entry, chunk_size=STREAM_CHUNK_SIZE):
+    with entry.open() as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_fetch(namespace, key, url, update_time=None, ttl=None):
+    """
+    Same as cached_fetch, but yields the body in chunks so it is never
+    held in memory. A download is written to the cache while it is read
+    and only stored once it is complete.
+    """
+    cache = get_cache()
+    entry = cache.lookup(namespace, key)
+
+    if entry is not None and entry.is_fresh(update_time, ttl):
+        logger.debug("Cache: hit %s/%s", namespace, key)
+        yield from _iter_entry(entry)
+        return
+
+    try:
+        req = http_get(url, stream=True)
+        req.raise_for_status()
+    except requests.RequestException:
+        if entry is None:
+            raise
+        logger.warning(
+            "Cache: network error, use cached %s/%s (age %ds).",
+            namespace,
+            key,
+            entry.age()
+        )
+        yield from _iter_entry(entry)
+        return
+
+    writer = cache.writer(namespace, key, update_time)
+    try:
+        with req:
+            for chunk in req.iter_content(STREAM_CHUNK_SIZE):
+                writer.write(chunk)
+                yield chunk
+    except BaseException:
+        # also reached when the consumer stops early (GeneratorExit).
+        writer.abort()
+        raise
+
+    if writer.size > 0:
+        writer.commit()
+    else:
+        writer.abort()
+
+
+def fetch_product_detail(lcid):
+    payload = cached_fetch(
+        "lcsc_detail",
+        lcid,
+        f"{LCSC_API}/wmsc/product/detail?productCode={lcid}",
+        ttl=PRODUCT_DETAIL_TTL,
+        validate=_json_has_result
+    )
+    return json.loads(payload)
+
+
+def fetch_product_svgs(lcid):
+    payload = cached_fetch(
+        "svgs",
+        lcid,
+        f"{EASYEDA_API}/api/products/{lcid}/svgs",
+        ttl=PRODUCT_TTL,
+        validate=_json_ok
+    )
+    return json.loads(payload)
+
+
+def fetch_product_components(lcid, update_time=None):
+    payload = cached_fetch(
+        "components",
+        lcid,
+        f"{EASYEDA_API}/api/products/{lcid}/components",
+        update_time=update_time,
+        ttl=PRODUCT_TTL,
+        validate=_json_ok,
+        get_update_time=_json_update_time
+    )
+    return json.loads(payload)
+
+
+def fetch_component(uuid, source_easyeda=True, update_time=None):
+    api = EASYEDA_API if source_easyeda else LCEDA_API
+    payload = cached_fetch(
+        "component" if source_easyeda else "component_lceda",
+        uuid,
+        f"{api}/api/components/{uuid}",
+        update_time=update_time,
+        ttl=COMPONENT_TTL,
+        validate=_json_ok,
+        get_update_time=_json_update_time
+    )
+    return json.loads(payload)
+
+
+def stream_3d_model(uuid, update_time=None):
+    """
+    OBJ model body in chunks, see stream_fetch.
+    """
+    return stream_fetch(
+        "3dmodel",
+        uuid,
+        f"{EASYEDA_API}/analyzer/api/3dmodel/{uuid}",
+        update_time=update_time
+    )
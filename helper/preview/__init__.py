@@ -0,0 +1,5 @@
+from .render import render_png, PREVIEW_SIZE
+from .cache import PreviewCache, get_preview_cache, get_render_executor
+from .cache import RENDERER_LOCAL, RENDERER_EASYEDA
+from .kicad_svg import footprint_svg, symbol_svg
+from .local import symbol_preview, footprint_preview
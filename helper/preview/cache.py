@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ..network import get_cache
+
+
+logger = logging.getLogger("KICONV")
+
+
+# bump when the rendering changes, older previews are not reused.
+PREVIEW_VERSION = 2
+
+MEMORY_SIZE = 128
+RENDER_WORKERS = 2
+
+CACHE_NAMESPACE = "previews"
+
+# who drew the preview, the converted part or the EasyEDA svg.
+RENDERER_LOCAL = "local"
+RENDERER_EASYEDA = "easyeda"
+
+
+class PreviewCache:
+    """
+    Rendered previews (PNG bytes), keyed by renderer, component uuid,
+    updateTime and size. A memory LRU in front of the on-disk response cache, a part
+    opened again is not rendered again.
+    """
+
+    def __init__(self, size=MEMORY_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(renderer, uuid, update_time, size):
+        return f"{renderer}:{uuid}:{update_time}:{size}:{PREVIEW_VERSION}"
+
+    def get(self, renderer, uuid, update_time, size):
+        key = self.key(renderer, uuid, update_time, size)
+
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                return png
+
+        png = get_cache().get(CACHE_NAMESPACE, key)
+        if png is not None:
+            self._remember(key, png)
+
+        return png
+
+    def put(self, renderer, uuid, update_time, size, png):
+        key = self.key(renderer, uuid, update_time, size)
+        self._remember(key, png)
+        get_cache().put(CACHE_NAMESPACE, key, png, update_time)
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, renderer, uuid, update_time, size, render):
+        """
+        Cached preview, `render()` makes the PNG bytes when there is none.
+        Without uuid nothing is cached.
+        """
+        if uuid is None:
+            return render()
+
+        png = self.get(renderer, uuid, update_time, size)
+        if png is not None:
+            logger.debug("Preview: cache hit %s", uuid)
+            return png
+
+        png = render()
+        self.put(renderer, uuid, update_time, size, png)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_preview_cache = PreviewCache()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_preview_cache():
+    return _preview_cache
+
+
+def get_render_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                thread_name_prefix="preview"
+            )
+
+    return _executor
@@ -0,0 +1,416 @@
+import math
+import re
+
+from xml.sax.saxutils import escape
+
+
+# tokens of a KiCad s-expression: parens, quoted strings, atoms.
+TOKEN_RE = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+# segments used to draw arcs.
+ARC_SEGMENTS = 24
+
+MARGIN = 0.05
+
+FOOTPRINT_BACKGROUND = "#001023"
+FOOTPRINT_LAYERS = {
+    'F.Cu': "#C83434",
+    'B.Cu': "#4D7FC4",
+    'F.SilkS': "#F2EDA1",
+    'B.SilkS': "#E8B2A7",
+    'F.Fab': "#AFAFAF",
+    'B.Fab': "#585D84",
+    'F.CrtYd': "#FF26E2",
+    'B.CrtYd': "#26E9FF",
+    'Edge.Cuts': "#D0D2CD",
+}
+FOOTPRINT_DEFAULT_COLOR = "#AFAFAF"
+# layers drawn first, copper under the silkscreen.
+FOOTPRINT_LAYER_ORDER = ['B.Cu', 'F.Cu', 'F.Fab', 'F.CrtYd', 'F.SilkS']
+
+SYMBOL_BACKGROUND = "#FFFFFF"
+SYMBOL_COLOR = "#840000"
+SYMBOL_TEXT_COLOR = "#008484"
+SYMBOL_FILL = "#FFFFC2"
+SYMBOL_LINE_WIDTH = 0.1524
+
+
+def parse_sexpr(text):
+    """
+    Parse a KiCad s-expression into nested lists of str, quoted strings are
+    unquoted.
+    """
+    stack = [[]]
+    for token in TOKEN_RE.findall(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            node = stack.pop()
+            stack[-1].append(node)
+        elif token[0] == '"':
+            stack[-1].append(token[1:-1].replace('\\"', '"'))
+        else:
+            stack[-1].append(token)
+
+    return stack[0]
+
+
+def find(node, key):
+    for child in node[1:]:
+        if isinstance(child, list) and child and child[0] == key:
+            return child
+
+    return None
+
+
+def find_all(node, key):
+    return [
+        child for child in node[1:]
+        if isinstance(child, list) and child and child[0] == key
+    ]
+
+
+def _xy(node):
+    return float(node[1]), float(node[2])
+
+
+def _pts(node):
+    pts = find(node, 'pts')
+    if pts is None:
+        return []
+
+    return [_xy(xy) for xy in find_all(pts, 'xy')]
+
+
+def _rotate(x, y, angle):
+    # clockwise on screen (y down), KiCad angles in degrees.
+    a = math.radians(angle)
+    return x * math.cos(a) - y * math.sin(a), x * math.sin(a) + y * math.cos(a)
+
+
+def _arc_points(center, start, angle):
+    cx, cy = center
+    dx, dy = start[0] - cx, start[1] - cy
+    points = []
+    for i in range(ARC_SEGMENTS + 1):
+        x, y = _rotate(dx, dy, angle * i / ARC_SEGMENTS)
+        points.append((cx + x, cy + y))
+
+    return points
+
+
+def _arc_3points(start, mid, end):
+    (x1, y1), (x2, y2), (x3, y3) = start, mid, end
+    d = 2 * (x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2))
+    if abs(d) < 1e-9:
+        return [start, mid, end]
+
+    s1, s2, s3 = x1 ** 2 + y1 ** 2, x2 ** 2 + y2 ** 2, x3 ** 2 + y3 ** 2
+    cx = (s1 * (y2 - y3) + s2 * (y3 - y1) + s3 * (y1 - y2)) / d
+    cy = (s1 * (x3 - x2) + s2 * (x1 - x3) + s3 * (x2 - x1)) / d
+
+    a1 = math.atan2(y1 - cy, x1 - cx)
+    a2 = math.atan2(y2 - cy, x2 - cx)
+    a3 = math.atan2(y3 - cy, x3 - cx)
+    sweep = (a3 - a1) % (2 * math.pi)
+    # go the way that passes through mid.
+    if (a2 - a1) % (2 * math.pi) > sweep:
+        sweep -= 2 * math.pi
+
+    return _arc_points((cx, cy), start, math.degrees(sweep))
+
+
+class SVGBuilder:
+    """
+    SVG elements in user units (mm) and the bounding box they cover.
+    """
+
+    def __init__(self):
+        self.elements = []
+        self.min_x = self.min_y = math.inf
+        self.max_x = self.max_y = -math.inf
+
+    def extend_bbox(self, points, pad=0):
+        for x, y in points:
+            self.min_x = min(self.min_x, x - pad)
+            self.min_y = min(self.min_y, y - pad)
+            self.max_x = max(self.max_x, x + pad)
+            self.max_y = max(self.max_y, y + pad)
+
+    def polyline(self, points, color, width, fill=None, closed=False):
+        if len(points) < 2:
+            return
+
+        self.extend_bbox(points, width / 2)
+        tag = "polygon" if closed else "polyline"
+        coords = " ".join(f"{x:.4f},{y:.4f}" for x, y in points)
+        self.elements.append(
+            f'<{tag} points="{coords}" fill="{fill or "none"}" '
+            f'stroke="{color}" stroke-width="{width:.4f}" '
+            'stroke-linecap="round" stroke-linejoin="round"/>'
+        )
+
+    def circle(self, center, radius, color, width=0, fill=None):
+        cx, cy = center
+        self.extend_bbox([(cx, cy)], radius + width / 2)
+        stroke = f'stroke="{color}" stroke-width="{width:.4f}"' if width else 'stroke="none"'
+        self.elements.append(
+            f'<circle cx="{cx:.4f}" cy="{cy:.4f}" r="{radius:.4f}" '
+            f'fill="{fill or "none"}" {stroke}/>'
+        )
+
+    def rect(self, center, size, angle, color, radius=0):
+        cx, cy = center
+        w, h = size
+        corners = [
+            _rotate(x, y, angle)
+            for x, y in ((-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2))
+        ]
+        self.extend_bbox([(cx + x, cy + y) for x, y in corners])
+        self.elements.append(
+            f'<rect x="{-w / 2:.4f}" y="{-h / 2:.4f}" width="{w:.4f}" '
+            f'height="{h:.4f}" rx="{radius:.4f}" fill="{color}" '
+            f'transform="translate({cx:.4f} {cy:.4f}) rotate({angle:.4f})"/>'
+        )
+
+    def text(self, position, value, color, size, anchor="middle"):
+        x, y = position
+        self.elements.append(
+            f'<text x="{x:.4f}" y="{y:.4f}" fill="{color}" '
+            f'font-size="{size:.4f}" font-family="sans-serif" '
+            f'text-anchor="{anchor}" dominant-baseline="central">'
+            f'{escape(value)}</text>'
+        )
+
+    def to_svg(self, background):
+        if self.min_x > self.max_x:
+            self.min_x = self.min_y = -1
+            self.max_x = self.max_y = 1
+
+        width = self.max_x - self.min_x
+        height = self.max_y - self.min_y
+        margin = max(width, height) * MARGIN
+        x = self.min_x - margin
+        y = self.min_y - margin
+        width += margin * 2
+        height += margin * 2
+
+        svg = "\n".join([
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'width="{width:.4f}" height="{height:.4f}" '
+            f'viewBox="{x:.4f} {y:.4f} {width:.4f} {height:.4f}">',
+            f'<rect x="{x:.4f}" y="{y:.4f}" width="{width:.4f}" '
+            f'height="{height:.4f}" fill="{background}"/>',
+            *self.elements,
+            "</svg>"
+        ])
+        bbox = {'x': x, 'y': y, 'width': width, 'height': height}
+
+        return svg, bbox
+
+
+def _layer_color(layers):
+    for layer in layers:
+        if layer in ('F.Cu', '*.Cu'):
+            return FOOTPRINT_LAYERS['F.Cu']
+        if layer == 'B.Cu':
+            return FOOTPRINT_LAYERS['B.Cu']
+
+    return FOOTPRINT_DEFAULT_COLOR
+
+
+def _draw_graphic(builder, node, color):
+    kind = node[0]
+    width_node = find(node, 'width')
+    width = float(width_node[1]) if width_node is not None else 0.1
+
+    if kind == 'fp_line':
+        builder.polyline(
+            [_xy(find(node, 'start')), _xy(find(node, 'end'))], color, width
+        )
+    elif kind == 'fp_circle':
+        center = _xy(find(node, 'center'))
+        end = _xy(find(node, 'end'))
+        radius = math.hypot(end[0] - center[0], end[1] - center[1])
+        builder.circle(center, radius, color, width)
+    elif kind == 'fp_arc':
+        # KiCad 5 format, start is the center, end the arc start.
+        points = _arc_points(
+            _xy(find(node, 'start')),
+            _xy(find(node, 'end')),
+            float(find(node, 'angle')[1])
+        )
+        builder.polyline(points, color, width)
+    elif kind == 'fp_poly':
+        builder.polyline(_pts(node), color, width, fill=color, closed=True)
+
+
+def _draw_pad(builder, node):
+    shape = node[3]
+    at = find(node, 'at')
+    center = _xy(at)
+    angle = -float(at[3]) if len(at) > 3 else 0
+    size = _xy(find(node, 'size'))
+    layers = find(node, 'layers')
+    color = _layer_color(layers[1:] if layers is not None else [])
+
+    if shape == 'circle':
+        builder.circle(center, size[0] / 2, color, fill=color)
+    elif shape == 'oval':
+        builder.rect(center, size, angle, color, radius=min(size) / 2)
+    elif shape == 'roundrect':
+        ratio = find(node, 'roundrect_rratio')
+        ratio = float(ratio[1]) if ratio is not None else 0.25
+        builder.rect(center, size, angle, color, radius=min(size) * ratio)
+    elif shape == 'custom':
+        # primitives are relative to the pad, the anchor is a circle.
+        builder.circle(center, min(size) / 2, color, fill=color)
+        primitives = find(node, 'primitives')
+        for poly in find_all(primitives, 'gr_poly') if primitives else []:
+            points = []
+            for x, y in _pts(poly):
+                x, y = _rotate(x, y, angle)
+                points.append((center[0] + x, center[1] + y))
+            builder.polyline(points, color, 0, fill=color, closed=True)
+    else:
+        builder.rect(center, size, angle, color)
+
+    drill = find(node, 'drill')
+    if drill is not None:
+        values = [x for x in drill[1:] if not isinstance(x, list) and x != 'oval']
+        if values:
+            builder.circle(center, float(values[0]) / 2, "none", fill=FOOTPRINT_BACKGROUND)
+
+
+def footprint_svg(text):
+    """
+    SVG of a .kicad_mod footprint, as written to the library. Returns
+    (svg, bbox).
+    """
+    module = parse_sexpr(text)[0]
+    builder = SVGBuilder()
+
+    graphics = {}
+    for node in module[1:]:
+        if not isinstance(node, list) or not node:
+            continue
+        if node[0] in ('fp_line', 'fp_circle', 'fp_arc', 'fp_poly'):
+            layer = find(node, 'layer')
+            layer = layer[1] if layer is not None else ""
+            graphics.setdefault(layer, []).append(node)
+
+    order = sorted(
+        graphics,
+        key=lambda x: FOOTPRINT_LAYER_ORDER.index(x) if x in FOOTPRINT_LAYER_ORDER else -1
+    )
+    for layer in order:
+        if layer == 'F.SilkS':
+            # silkscreen over the pads.
+            continue
+        color = FOOTPRINT_LAYERS.get(layer, FOOTPRINT_DEFAULT_COLOR)
+        for node in graphics[layer]:
+            _draw_graphic(builder, node, color)
+
+    for node in find_all(module, 'pad'):
+        _draw_pad(builder, node)
+
+    for node in graphics.get('F.SilkS', []):
+        _draw_graphic(builder, node, FOOTPRINT_LAYERS['F.SilkS'])
+
+    return builder.to_svg(FOOTPRINT_BACKGROUND)
+
+
+def _flip(points):
+    # symbol coordinates are y up.
+    return [(x, -y) for x, y in points]
+
+
+def _symbol_fill(node):
+    fill = find(node, 'fill')
+    if fill is None:
+        return None
+
+    kind = find(fill, 'type')
+    if kind is not None and kind[1] == 'background':
+        return SYMBOL_FILL
+    if kind is not None and kind[1] == 'outline':
+        return SYMBOL_COLOR
+
+    return None
+
+
+def _symbol_width(node):
+    stroke = find(node, 'stroke')
+    width = find(stroke, 'width') if stroke is not None else None
+    width = float(width[1]) if width is not None else 0
+
+    return width or SYMBOL_LINE_WIDTH
+
+
+def _draw_symbol_item(builder, node):
+    kind = node[0]
+    width = _symbol_width(node)
+    fill = _symbol_fill(node)
+
+    if kind == 'rectangle':
+        (x1, y1), (x2, y2) = _flip([_xy(find(node, 'start')), _xy(find(node, 'end'))])
+        points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        builder.polyline(points, SYMBOL_COLOR, width, fill=fill, closed=True)
+    elif kind == 'circle':
+        center = _flip([_xy(find(node, 'center'))])[0]
+        radius = float(find(node, 'radius')[1])
+        builder.circle(center, radius, SYMBOL_COLOR, width, fill=fill)
+    elif kind == 'arc' and find(node, 'mid') is not None:
+        points = _flip([
+            _xy(find(node, 'start')), _xy(find(node, 'mid')), _xy(find(node, 'end'))
+        ])
+        builder.polyline(_arc_3points(*points), SYMBOL_COLOR, width, fill=fill)
+    elif kind in ('polyline', 'arc'):
+        builder.polyline(_flip(_pts(node)), SYMBOL_COLOR, width, fill=fill)
+    elif kind == 'bezier':
+        points = _flip(_pts(node))
+        if len(points) == 4:
+            # cubic, sampled.
+            p0, p1, p2, p3 = points
+            curve = []
+            for i in range(ARC_SEGMENTS + 1):
+                t = i / ARC_SEGMENTS
+                a, b, c, d = (1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3
+                curve.append((
+                    a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+                    a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1]
+                ))
+            points = curve
+        builder.polyline(points, SYMBOL_COLOR, width, fill=fill)
+    elif kind == 'pin':
+        at = find(node, 'at')
+        x, y = _xy(at)
+        angle = float(at[3]) if len(at) > 3 else 0
+        length = float(find(node, 'length')[1])
+        dx = math.cos(math.radians(angle))
+        dy = math.sin(math.radians(angle))
+        start, end = _flip([(x, y), (x + dx * length, y + dy * length)])
+        builder.polyline([start, end], SYMBOL_COLOR, SYMBOL_LINE_WIDTH)
+
+        name = find(node, 'name')
+        if name is not None and name[1] not in ("", "~"):
+            offset = 0.5
+            position = (end[0] + dx * offset, end[1] - dy * offset)
+            anchor = "start" if dx > 0.5 else "end" if dx < -0.5 else "middle"
+            builder.text(position, name[1], SYMBOL_TEXT_COLOR, 1.0, anchor)
+
+
+def symbol_svg(text):
+    """
+    SVG of a symbol (create_schematic output) as written to the library.
+    Returns (svg, bbox).
+    """
+    symbol = parse_sexpr(text)[0]
+    builder = SVGBuilder()
+
+    for unit in find_all(symbol, 'symbol'):
+        for node in unit[1:]:
+            if isinstance(node, list) and node:
+                _draw_symbol_item(builder, node)
+
+    return builder.to_svg(SYMBOL_BACKGROUND)
@@ -0,0 +1,58 @@
+from KicadModTree import KicadFileHandler
+
+from ..footprint import SerializedFootprint
+from .cache import get_preview_cache, RENDERER_LOCAL
+from .kicad_svg import footprint_svg, symbol_svg
+from .render import render_png, PREVIEW_SIZE
+
+
+def symbol_preview(component, size=PREVIEW_SIZE, scale=10):
+    """
+    PNG preview of the symbol of a loaded LCComponent, drawn from the
+    converted symbol, what is written to the library. None without symbol.
+    """
+    if component.symbol is None:
+        return None
+
+    def render():
+        data = component.gen_symbol_data(
+            component.symbol_name, component.footprint_name, scale
+        )
+        svg, bbox = symbol_svg(data)
+        return render_png(svg, bbox, size)
+
+    return get_preview_cache().get_or_render(
+        RENDERER_LOCAL,
+        component.raw_data.get('uuid'),
+        component.raw_data.get('updateTime'),
+        f"{size}:{scale}",
+        render
+    )
+
+
+def footprint_preview(component, size=PREVIEW_SIZE):
+    """
+    PNG preview of the footprint of a loaded LCComponent, drawn from the
+    converted footprint. None without footprint.
+    """
+    if component.footprint is None:
+        return None
+
+    def render():
+        data = component.gen_footprint_data(
+            component.footprint_name, with_3d=False
+        )
+        if isinstance(data, SerializedFootprint):
+            text = data.serialize(timestamp=0)
+        else:
+            text = KicadFileHandler(data).serialize(timestamp=0)
+        svg, bbox = footprint_svg(text)
+        return render_png(svg, bbox, size)
+
+    return get_preview_cache().get_or_render(
+        RENDERER_LOCAL,
+        component.footprint.get('uuid'),
+        component.footprint.get('updateTime'),
+        size,
+        render
+    )
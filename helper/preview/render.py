@@ -0,0 +1,29 @@
+import io
+
+from cairosvg.parser import Tree as svgTree
+from cairosvg.surface import PNGSurface
+
+
+# px, longer side of the symbol / footprint previews.
+PREVIEW_SIZE = 240
+
+
+def render_png(svg, bbox, size=PREVIEW_SIZE):
+    """
+    Rasterize an EasyEDA preview svg to PNG bytes, directly at the display
+    size: the longer side of `bbox` is `size` px.
+    """
+    if isinstance(svg, str):
+        svg = svg.encode()
+
+    if bbox['height'] > bbox['width']:
+        output_size = {'output_height': size}
+    else:
+        output_size = {'output_width': size}
+
+    tree = svgTree(bytestring=svg, unsafe=False)
+    output = io.BytesIO()
+    instance = PNGSurface(tree, output, 96, **output_size)
+    instance.finish()
+
+    return output.getvalue()
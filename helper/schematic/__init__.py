@@ -1,2 +1,3 @@
 from .schematic import create_schematic
-from .schematic_manager import SchematicManager, SchematicExist, SchematicNotFound
\ No newline at end of file
+from .schematic_manager import SchematicManager, SchematicExist, SchematicNotFound
+from .schematic_manager import SchematicBatch
\ No newline at end of file
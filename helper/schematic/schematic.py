@@ -4,6 +4,7 @@
 # import os
 import logging
 from dataclasses import dataclass
+from functools import lru_cache
 
 # from KicadModTree import *
 from .schematic_handlers import SCHEMATIC_HANDLER
@@ -12,6 +13,10 @@ from .schematic_handlers import SCHEMATIC_HANDLER
 logger = logging.getLogger("KICONV")
 
 
+# drawings kept, generic symbols (resistors, capacitors...) share one.
+DRAWING_MEMO_SIZE = 256
+
+
 def mil2mm(x):
     x = round(int(x) * 0.0254, 4)
     return x
@@ -33,32 +38,20 @@ class KICADSchematic:
         self.wire_b = 0
 
 
-def create_schematic(
-    lcid,
-    schematic_title,
-    schematic_shape,
-    symmbolic_prefix,
-    footprint_name,
-    datasheet_link,
-    x_offset=0,
-    y_offset=0,
-    x_size=0,
-    y_size=0,
-    scale=10,
-    desc="",
-    category=" - ",
-    manufacturer=""
-):
+@lru_cache(maxsize=DRAWING_MEMO_SIZE)
+def render_drawing(schematic_shape, c_x, c_y, scale=10):
+    """
+    Convert the EasyEDA shapes (a tuple) of a symbol. Returns the drawing
+    commands and the wires count on each side (l, r, t, b), used to place
+    the properties.
 
-    kicad_schematic = KICADSchematic(lcid=lcid)
+    Memoized, parts with the same symbol geometry are converted once.
+    """
+    kicad_schematic = KICADSchematic(lcid=None)
     kicad_schematic.part += 1
     kicad_schematic.scale = scale
-    # kicad_schematic.c_x = x_offset + x_size / 2
-    # kicad_schematic.c_y = y_offset + y_size / 2
-    kicad_schematic.c_x = float(x_offset)
-    kicad_schematic.c_y = float(y_offset)
-
-    logger.info(f"Schematic: creating schematic...")
+    kicad_schematic.c_x = c_x
+    kicad_schematic.c_y = c_y
 
     for line in schematic_shape:
         # split and remove empty string in list
@@ -74,14 +67,47 @@ def create_schematic(
         build_func = SCHEMATIC_HANDLER.get(model)
         build_func(args[1:], kicad_schematic)   # type: ignore
 
-    refname_x = -int(x_size / 2 * scale) + 60 + kicad_schematic.wire_l * 120
-    refname_y = int(y_size / 2 * scale) + 60 - kicad_schematic.wire_t * 120
-    compname_x = int(x_size / 2 * scale) + 40 - kicad_schematic.wire_r * 120
-    compname_y = -int(y_size / 2 * scale) - 50 + kicad_schematic.wire_b * 120
-    footprint_x = int(x_size / 2 * scale) + 200 - kicad_schematic.wire_r * 120
-    footprint_y = int(y_size / 2 * scale) + 180 - kicad_schematic.wire_t * 120
+    wires = (
+        kicad_schematic.wire_l,
+        kicad_schematic.wire_r,
+        kicad_schematic.wire_t,
+        kicad_schematic.wire_b
+    )
+    return "\n".join(kicad_schematic.drawing), wires
+
+
+def create_schematic(
+    lcid,
+    schematic_title,
+    schematic_shape,
+    symmbolic_prefix,
+    footprint_name,
+    datasheet_link,
+    x_offset=0,
+    y_offset=0,
+    x_size=0,
+    y_size=0,
+    scale=10,
+    desc="",
+    category=" - ",
+    manufacturer=""
+):
+
+    logger.info(f"Schematic: creating schematic...")
 
-    draw_cmds = "\n".join(kicad_schematic.drawing)
+    # c_x = x_offset + x_size / 2
+    # c_y = y_offset + y_size / 2
+    draw_cmds, wires = render_drawing(
+        tuple(schematic_shape), float(x_offset), float(y_offset), scale
+    )
+    wire_l, wire_r, wire_t, wire_b = wires
+
+    refname_x = -int(x_size / 2 * scale) + 60 + wire_l * 120
+    refname_y = int(y_size / 2 * scale) + 60 - wire_t * 120
+    compname_x = int(x_size / 2 * scale) + 40 - wire_r * 120
+    compname_y = -int(y_size / 2 * scale) - 50 + wire_b * 120
+    footprint_x = int(x_size / 2 * scale) + 200 - wire_r * 120
+    footprint_y = int(y_size / 2 * scale) + 180 - wire_t * 120
 
     component_describe = [
         f"  (symbol \"{schematic_title}\" (pin_names (offset 1.016)) (in_bom yes) (on_board yes)",
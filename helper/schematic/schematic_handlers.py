@@ -1,5 +1,5 @@
 import logging
-from svg.path import parse_path, Move, Line, Close, CubicBezier, Arc
+from ..svgpath import parse_path, Move, Line, Close, CubicBezier, Arc
 
 logger = logging.getLogger("KICONV")
 
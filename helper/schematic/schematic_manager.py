@@ -1,12 +1,30 @@
+import hashlib
+import json
 import logging
+import os
 import re
+import shutil
+import tempfile
+from collections import namedtuple
 from pathlib import Path
 
 
 logger = logging.getLogger("KICONV")
 
 
-SYMBOL_RE = re.compile(r'^\s*\(symbol \"(?P<SYMBOL_NAME>.+)\" \(pin')
+SYMBOL_RE = re.compile(
+    rb'^\s*\(symbol \"(?P<SYMBOL_NAME>.+)\" \((?:pin|extends \"(?P<PARENT>.+)\"\))'
+)
+# the drawing unit of a symbol, (symbol "NAME_1_0".
+UNIT_RE = re.compile(rb'^\s*\(symbol \".*_\d+_\d+\"\s*$')
+
+# byte range [start, end) of a symbol in the library, sha1 of it, sha1 of
+# its drawing (None for derived symbols) and the symbol it extends.
+SymbolEntry = namedtuple(
+    'SymbolEntry',
+    ['start', 'end', 'digest', 'geometry', 'parent'],
+    defaults=(None, None)
+)
 
 
 TEMPLATE_LIB_HEADER = b"""\
@@ -14,6 +32,12 @@ TEMPLATE_LIB_HEADER = b"""\
 """
 TEMPLATE_LIB_FOOTER = b")\n"
 
+COPY_BUFFER_SIZE = 1024 * 1024
+
+INDEX_VERSION = 2
+# bytes of the library hashed to detect a replaced file.
+INDEX_HEADER_SIZE = 4096
+
 
 class SchematicExist(Exception):
     pass
@@ -23,18 +47,345 @@ class SchematicNotFound(Exception):
     pass
 
 
+def _copy_range(src, dst, length, bufsize=COPY_BUFFER_SIZE):
+    while length > 0:
+        chunk = src.read(min(bufsize, length))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def split_symbol(ctx):
+    """
+    Split a symbol written by create_schematic into its header line, its
+    property lines and its drawing lines (from the unit symbol line to the
+    end). The drawing is empty for a derived symbol.
+    """
+    lines = ctx.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if UNIT_RE.match(line):
+            return lines[0], lines[1:i], lines[i:]
+
+    return lines[0], lines[1:-1], []
+
+
+def symbol_parent(ctx):
+    m = SYMBOL_RE.match(ctx)
+    if m is None or m.group('PARENT') is None:
+        return None
+
+    return m.group('PARENT').decode()
+
+
+def symbol_geometry(ctx):
+    """
+    sha1 of the drawing of a symbol, the same for symbols that only differ
+    in their properties. None for a derived symbol.
+    """
+    _, _, drawing = split_symbol(ctx)
+    if not drawing:
+        return None
+
+    return hashlib.sha1(b"".join(drawing[1:])).hexdigest()
+
+
+def symbol_entry(start, ctx):
+    return SymbolEntry(
+        start,
+        start + len(ctx),
+        hashlib.sha1(ctx).hexdigest(),
+        symbol_geometry(ctx),
+        symbol_parent(ctx)
+    )
+
+
+def derive_symbol(ctx, name, parent):
+    """
+    Rewrite a symbol as a KiCad derived symbol of `parent`, which has the
+    same drawing. Only the properties are kept.
+    """
+    _, properties, _ = split_symbol(ctx)
+    header = f'  (symbol "{name}" (extends "{parent}")\n'.encode()
+    return header + b"".join(properties) + b"  )\n"
+
+
+def expand_symbol(ctx, name, parent_ctx, parent):
+    """
+    Rewrite a derived symbol as a full symbol, with the drawing of
+    `parent_ctx`. Used before the parent drawing is replaced.
+    """
+    _, properties, _ = split_symbol(ctx)
+    header, _, drawing = split_symbol(parent_ctx)
+    header = header.replace(
+        f'(symbol "{parent}"'.encode(), f'(symbol "{name}"'.encode(), 1
+    )
+    unit = drawing[0].replace(
+        f'"{parent}_'.encode(), f'"{name}_'.encode(), 1
+    )
+    return header + b"".join(properties) + unit + b"".join(drawing[1:])
+
+
+def _fsync_dir(path):
+    # make the rename durable, not supported on windows.
+    if os.name != 'posix':
+        return
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SchematicBatch:
+    """
+    Buffer many symbol adds / updates and write them to the library in a
+    single pass, committed by an atomic rename of a temp file.
+
+        with manager.batch() as batch:
+            batch.add("R_0603", data)
+            batch.add("LM358", data, update=True)
+
+    A symbol with the same drawing as one already in the library (or added
+    earlier in the batch) is written as a derived symbol of it, see
+    SchematicManager.derive.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        # title -> encoded symbol, insertion ordered.
+        self.updates = {}
+        self.inserts = {}
+        # title -> parent of the pending symbols, parent -> titles.
+        self.parents = {}
+        self.children = {}
+        # geometry -> title of the full symbols inserted.
+        self.bases = {}
+
+    def __len__(self):
+        return len(self.updates) + len(self.inserts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def add(self, schematic_title, schematic_data, update=False):
+        exist = (
+            schematic_title in self.inserts
+            or self.manager.get_schematic(schematic_title)
+        )
+        if exist and not update:
+            logger.warning(
+                "Schematic Manager: [ADD_SCH] %s already in DB.",
+                schematic_title
+            )
+            raise SchematicExist()
+
+        ctx = schematic_data.encode() + b"\n"
+        entry = self.manager.db.get(schematic_title)
+
+        if self.manager.derive:
+            ctx = self._derive(schematic_title, ctx, entry)
+
+        if schematic_title in self.inserts or entry is None:
+            self._put(schematic_title, ctx, self.inserts)
+        elif hashlib.sha1(ctx).hexdigest() != entry.digest:
+            self._put(schematic_title, ctx, self.updates)
+        elif schematic_title in self.updates:
+            del self.updates[schematic_title]
+            self._set_parent(schematic_title, None)
+            del self.parents[schematic_title]
+
+    def _set_parent(self, name, parent):
+        old = self.parents.get(name)
+        if old is not None:
+            self.children[old].discard(name)
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(name)
+        self.parents[name] = parent
+
+    def _put(self, name, ctx, target):
+        target[name] = ctx
+        self._set_parent(name, symbol_parent(ctx))
+
+        if target is self.inserts and self.parents[name] is None:
+            if name in self.bases.values():
+                self.bases = {k: v for k, v in self.bases.items() if v != name}
+            geometry = symbol_geometry(ctx)
+            if geometry is not None:
+                self.bases.setdefault(geometry, name)
+
+    def _current(self, name):
+        ctx = self.inserts.get(name) or self.updates.get(name)
+        if ctx is None:
+            ctx = self.manager.read_symbol(name)
+
+        return ctx
+
+    def _derive(self, title, ctx, entry):
+        geometry = symbol_geometry(ctx)
+        if geometry is None:
+            return ctx
+
+        children = [
+            x for x in self.manager.children(title) if x not in self.parents
+        ]
+        children += sorted(self.children.get(title, ()))
+        if children:
+            old_ctx = self._current(title)
+            if symbol_geometry(old_ctx) == geometry:
+                # keep the base of its derived symbols.
+                return ctx
+
+            # the drawing changes, derived symbols get the old one.
+            for name in children:
+                target = self.updates
+                if name in self.inserts or name not in self.manager.db:
+                    target = self.inserts
+                self._put(
+                    name,
+                    expand_symbol(self._current(name), name, old_ctx, title),
+                    target
+                )
+
+        # KiCad needs the parent before the derived symbol in the library.
+        if entry is None:
+            parent = self.manager.find_base(geometry)
+            if parent is None:
+                parent = self.bases.get(geometry)
+        else:
+            parent = self.manager.find_base(geometry, before=entry.start)
+
+        if parent is None or parent == title:
+            return ctx
+
+        pending = self.updates.get(parent)
+        if pending is not None and symbol_geometry(pending) != geometry:
+            return ctx
+
+        logger.debug("Schematic Manager: %s derived from %s.", title, parent)
+        return derive_symbol(ctx, title, parent)
+
+    def rollback(self):
+        self.updates = {}
+        self.inserts = {}
+        self.parents = {}
+        self.children = {}
+        self.bases = {}
+
+    def commit(self):
+        if not self:
+            return
+
+        manager = self.manager
+        lib_path = manager.path
+        db = {}
+
+        fd, tmp_name = tempfile.mkstemp(
+            dir=manager.lib_root, prefix=f".{lib_path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                if lib_path.exists():
+                    with lib_path.open('rb') as src:
+                        self._write_existing(src, dst, db)
+                    shutil.copymode(lib_path, tmp_name)
+                else:
+                    dst.write(TEMPLATE_LIB_HEADER)
+
+                for name, ctx in self.inserts.items():
+                    db[name] = symbol_entry(dst.tell(), ctx)
+                    dst.write(ctx)
+
+                dst.write(TEMPLATE_LIB_FOOTER)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            os.replace(tmp_name, lib_path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+        _fsync_dir(manager.lib_root)
+
+        logger.info(
+            "Schematic Manager: Batch committed, %s added, %s updated.",
+            len(self.inserts),
+            len(self.updates)
+        )
+        manager.set_db(db)
+        manager.save_index()
+        self.rollback()
+
+    def _write_existing(self, src, dst, db):
+        """
+        Copy the current library without its footer, replacing updated
+        symbols in place. Symbols are visited in file order so the source
+        is read sequentially once.
+        """
+        src.seek(0, 2)
+        tail = src.tell() - len(TEMPLATE_LIB_FOOTER)
+        src.seek(0)
+
+        entries = sorted(self.manager.db.items(), key=lambda x: x[1].start)
+        pos = 0
+        for name, entry in entries:
+            _copy_range(src, dst, entry.start - pos)
+            start = dst.tell()
+
+            ctx = self.updates.get(name)
+            if ctx is None:
+                _copy_range(src, dst, entry.end - entry.start)
+                db[name] = entry._replace(start=start, end=dst.tell())
+            else:
+                src.seek(entry.end)
+                dst.write(ctx)
+                db[name] = symbol_entry(start, ctx)
+            pos = entry.end
+
+        _copy_range(src, dst, tail - pos)
+
+
 class SchematicManager:
+    """
+    With `derive`, a symbol with the same drawing as one already in the
+    library (generic resistors, capacitors...) is written as a KiCad
+    derived symbol, (extends "..."), which only has its own properties.
+    """
 
-    def __init__(self, path, name="lcsc"):
+    def __init__(self, path, name="lcsc", derive=True):
         self.lib_name = name
         self.lib_root = Path(path)
         self.path = self.lib_root.joinpath(f"{name}.kicad_sym")
-        self.db = []
+        self.index_path = self.lib_root.joinpath(f"{name}.kicad_sym.idx")
+        self.derive = derive
+        # symbol name -> SymbolEntry
+        self.db = {}
         self.alias = {}
         self._db_builded = False
+        # (geometry -> base symbol, parent -> derived symbols), from db.
+        self._links = None
+        # db changed since the index was written, see flush_index.
+        self._index_dirty = False
 
         self.post_init_check()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.flush_index()
+
     def post_init_check(self):
         if not self.lib_root.exists():
             logger.warning("Schematic Manager: Schematic Path not exists, create it.")
@@ -44,6 +395,126 @@ class SchematicManager:
         if not self._db_builded:
             self.build_schematic_db()
 
+    def set_db(self, db):
+        self.db = db
+        self._links = None
+
+    def _get_links(self):
+        if self._links is None:
+            bases = {}
+            children = {}
+            entries = sorted(self.db.items(), key=lambda x: x[1].start)
+            for name, entry in entries:
+                if entry.parent is not None:
+                    children.setdefault(entry.parent, []).append(name)
+                elif entry.geometry is not None:
+                    bases.setdefault(entry.geometry, name)
+            self._links = (bases, children)
+
+        return self._links
+
+    def find_base(self, geometry, before=None):
+        """
+        Full symbol with the drawing `geometry`, only if it starts before
+        the byte offset `before`.
+        """
+        name = self._get_links()[0].get(geometry)
+        if name is None:
+            return None
+        if before is not None and self.db[name].start >= before:
+            return None
+
+        return name
+
+    def children(self, name):
+        return self._get_links()[1].get(name, [])
+
+    def read_symbol(self, name):
+        entry = self.db.get(name)
+        if entry is None:
+            return None
+
+        with self.path.open('rb') as fp:
+            fp.seek(entry.start)
+            return fp.read(entry.end - entry.start)
+
+    def _lib_signature(self):
+        stat = self.path.stat()
+        with self.path.open('rb') as fp:
+            header = hashlib.sha1(fp.read(INDEX_HEADER_SIZE)).hexdigest()
+
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'header': header,
+        }
+
+    def load_index(self):
+        """
+        Load the sidecar index, only if it was written for the library as it
+        is on disk now (same size, mtime and header hash).
+        """
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return False
+
+        if index.get('version') != INDEX_VERSION:
+            return False
+
+        try:
+            signature = self._lib_signature()
+        except OSError:
+            return False
+
+        if any(index.get(k) != v for k, v in signature.items()):
+            logger.info("Schematic Manager: [DB_BUILD] Index outdated.")
+            return False
+
+        self.set_db({
+            name: SymbolEntry(*entry)
+            for name, entry in index['symbols'].items()
+        })
+        return True
+
+    def save_index(self):
+        if not self.path.exists():
+            return
+
+        index = {'version': INDEX_VERSION}
+        index.update(self._lib_signature())
+        index['symbols'] = {name: list(entry) for name, entry in self.db.items()}
+
+        tmp_name = None
+        try:
+            fd, tmp_name = tempfile.mkstemp(
+                dir=self.lib_root,
+                prefix=f".{self.index_path.name}.",
+                suffix=".tmp"
+            )
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(index, fp)
+            os.replace(tmp_name, self.index_path)
+        except OSError:
+            logger.warning(
+                "Schematic Manager: Unable to write index %s.",
+                self.index_path
+            )
+            if tmp_name is not None and os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            return
+
+        self._index_dirty = False
+
+    def flush_index(self):
+        """
+        Write the index if single adds / updates changed the db. Those only
+        mark it dirty, an index left behind is outdated and rebuilt by the
+        next load.
+        """
+        if self._index_dirty:
+            self.save_index()
+
     def build_schematic_db(self, rebuild=False):
         if self._db_builded and not rebuild:
             logger.info(
@@ -52,30 +523,77 @@ class SchematicManager:
             return
 
         self._db_builded = True
-        last_def = None
+        self.set_db({})
 
         if not self.path.exists():
             return
 
-        with self.path.open('r') as fp:
+        if not rebuild and self.load_index():
+            logger.info(
+                "Schematic Manager: [DB_BUILD] %s symbols loaded from index.",
+                len(self.db)
+            )
+            return
+
+        # one pass over the file, a symbol ends where the next one starts.
+        # the hash is fed one line late so the library footer is not part
+        # of the last symbol. the drawing hash starts after the unit line.
+        name = None
+        parent = None
+        start = 0
+        offset = 0
+        hasher = None
+        geometry = None
+        pending = b""
+
+        def add_entry(end):
+            self.db[name] = SymbolEntry(
+                start,
+                end,
+                hasher.hexdigest(),
+                geometry.hexdigest() if geometry is not None else None,
+                parent
+            )
+
+        with self.path.open('rb') as fp:
             for line in fp:
-                # line = line.strip()
-                # if line == "" or line[0] == "#":
-                #     continue
                 m = SYMBOL_RE.match(line)
 
-                if m:
-                    self.db.append(m.group('SYMBOL_NAME'))
-
-                # # find def name
-                # if line[:3] == 'DEF':
-                #     last_def = line.split(' ')[1]
-                #     self.db.append(last_def)
+                if name is not None:
+                    hasher.update(pending)
+                    if geometry is not None:
+                        geometry.update(pending)
+                    elif UNIT_RE.match(pending):
+                        geometry = hashlib.sha1()
 
-                # elif line[:5] == 'ALIAS':
-                #     als = line.split(' ')[1:]
-                #     for ali in als:
-                #         self.alias[ali] = last_def
+                if m:
+                    if name is not None:
+                        add_entry(offset)
+                    name = m.group('SYMBOL_NAME').decode()
+                    parent = m.group('PARENT')
+                    if parent is not None:
+                        parent = parent.decode()
+                    start = offset
+                    hasher = hashlib.sha1()
+                    geometry = None
+
+                pending = line
+                offset += len(line)
+
+        if name is not None:
+            end = offset
+            if pending.strip() == TEMPLATE_LIB_FOOTER.strip():
+                end -= len(pending)
+            else:
+                hasher.update(pending)
+                if geometry is not None:
+                    geometry.update(pending)
+            add_entry(end)
+
+        logger.info(
+            "Schematic Manager: [DB_BUILD] %s symbols indexed.", len(self.db)
+        )
+        self.save_index()
 
     def get_schematic(self, schematic_title):
         self.check_db()
@@ -88,52 +606,50 @@ class SchematicManager:
 
         return False
 
+    def batch(self):
+        self.check_db()
+        return SchematicBatch(self)
+
     def update_schematic(self, schematic_title, schematic_data):
-        sch_find = False
-        start_pos = 0
-        # sch_magic = f"  (symbol \"{schematic_title}\" (pin_names".encode()
-
-        with self.path.open('rb+') as fp:
-            while True:
-                line = fp.readline()
-                m = SYMBOL_RE.match(line.decode())
-                if m and m.group('SYMBOL_NAME') == schematic_title:
-                    sch_find = True
-                    logger.debug(
-                        "Schematic Manager: Find Sch at C-pos %s. Line Size: %s",
-                        fp.tell(),
-                        len(line)
-                    )
+        self.check_db()
 
-                    fp.seek(-len(line), 1)
-                    start_pos = fp.tell()
-                    logger.debug(
-                        f"Schematic Manager: Sch S-pos at %s.",
-                        start_pos
-                    )
-                    fp.readline()
-                    break
+        entry = self.db.get(schematic_title)
+        if entry is None:
+            logger.critical("Schematic Manager: Unable to update schematic, schematic not find.")
+            raise SchematicNotFound()
+
+        # the batch works out the derived form of the symbol, and the
+        # derived symbols to rewrite when its drawing changes.
+        batch = self.batch()
+        batch.add(schematic_title, schematic_data, update=True)
+        ctx = batch.updates.get(schematic_title)
+        if ctx is None:
+            logger.info(
+                "Schematic Manager: %s unchanged, skip update.",
+                schematic_title
+            )
+            return
 
-            # buffer remind ctx
-            if not sch_find:
-                logger.critical("Schematic Manager: Unable to update schematic, schematic not find.")
-                raise SchematicNotFound()
+        logger.debug(
+            "Schematic Manager: Update Sch at [%s, %s).",
+            entry.start,
+            entry.end
+        )
 
-            buffer = None
+        if len(batch) == 1 and len(ctx) == entry.end - entry.start:
+            # same size, overwrite the byte range in place.
+            with self.path.open('rb+') as fp:
+                fp.seek(entry.start)
+                fp.write(ctx)
 
-            while True:
-                line = fp.readline()
-                m = SYMBOL_RE.match(line.decode())
-                if m:
-                    print(line)
-                    buffer = line + fp.read()
-                    break
+            self.db[schematic_title] = symbol_entry(entry.start, ctx)
+            self._links = None
+            self._index_dirty = True
+            return
 
-            fp.seek(start_pos, 0)
-            fp.truncate()
-            fp.write(schematic_data.encode())
-            fp.write(b'\n')
-            fp.write(buffer)
+        # size changed, stream the library through a temp file with a
+        # fixed buffer instead of holding the tail in memory.
+        batch.commit()
 
     def add_schematic(
         self,
@@ -176,18 +692,32 @@ class SchematicManager:
             #     )
             #     schematic_title = new_schematic_title
 
+        sch_ctx = schematic_data.encode() + b"\n"
+
+        geometry = symbol_geometry(sch_ctx) if self.derive else None
+        parent = self.find_base(geometry) if geometry is not None else None
+        if parent is not None:
+            logger.info(
+                "Schematic Manager: %s derived from %s.",
+                schematic_title,
+                parent
+            )
+            sch_ctx = derive_symbol(sch_ctx, schematic_title, parent)
+
         # create file if not exist
         if not self.path.exists():
-            ctx = TEMPLATE_LIB_HEADER + schematic_data.encode() + b"\n"
-            ctx += TEMPLATE_LIB_FOOTER
+            start = len(TEMPLATE_LIB_HEADER)
+            ctx = TEMPLATE_LIB_HEADER + sch_ctx + TEMPLATE_LIB_FOOTER
             self.path.write_bytes(ctx)
         else:
             with self.path.open('rb+') as fp:
                 fp.seek(-len(TEMPLATE_LIB_FOOTER), 2)
+                start = fp.tell()
                 fp.truncate()
-                fp.write(schematic_data.encode())
-                fp.write(b'\n')
+                fp.write(sch_ctx)
                 fp.write(TEMPLATE_LIB_FOOTER)
 
-        self.db.append(schematic_title)
+        self.db[schematic_title] = symbol_entry(start, sch_ctx)
+        self._links = None
+        self._index_dirty = True
         logger.info("Schematic Manager: Schematic %s Added.", schematic_title)
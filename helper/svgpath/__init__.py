@@ -0,0 +1,2 @@
+from .path import parse_path, clear_cache
+from .path import Move, Line, Close, CubicBezier, Arc
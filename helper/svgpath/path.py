@@ -0,0 +1,339 @@
+import logging
+import re
+from functools import lru_cache
+from math import acos, cos, degrees, radians, sin, sqrt
+
+from svg.path import parse_path as svg_parse_path
+from svg.path import path as svg_path
+
+
+logger = logging.getLogger("KICONV")
+
+
+# Small SVG path parser for the commands EasyEDA emits (M L H V C A Z).
+# Segments have the same attributes as the svg.path ones (start / end are
+# complex, Arc has center, theta, delta), anything else is parsed with
+# svg.path and converted.
+
+COMMAND_RE = re.compile(r"([MmLlHhVvCcAaZz])")
+NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+SEPARATORS = str.maketrans("", "", " \t\r\n,")
+
+# number of values per command.
+ARGUMENT_COUNT = {
+    "M": 2,
+    "L": 2,
+    "H": 1,
+    "V": 1,
+    "C": 6,
+    "A": 7,
+    "Z": 0,
+}
+
+CACHE_SIZE = 4096
+
+
+class UnsupportedPath(ValueError):
+    pass
+
+
+class Segment:
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(start={self.start}, end={self.end})"
+
+    def length(self):
+        distance = self.end - self.start
+        return sqrt(distance.real ** 2 + distance.imag ** 2)
+
+
+class Move(Segment):
+    __slots__ = ()
+
+    def __init__(self, to):
+        super().__init__(to, to)
+
+    def length(self):
+        return 0
+
+
+class Line(Segment):
+    __slots__ = ()
+
+
+class Close(Segment):
+    __slots__ = ()
+
+
+class CubicBezier(Segment):
+    __slots__ = ('control1', 'control2')
+
+    def __init__(self, start, control1, control2, end):
+        super().__init__(start, end)
+        self.control1 = control1
+        self.control2 = control2
+
+    def length(self):
+        # no closed form, use the svg.path approximation.
+        return svg_path.CubicBezier(
+            self.start, self.control1, self.control2, self.end
+        ).length()
+
+
+class Arc(Segment):
+    """
+    Elliptical arc, the center parameterization is computed once with the
+    same formula as svg.path. center is None for an arc that is really a
+    point or a straight line.
+    """
+    __slots__ = (
+        'radius', 'rotation', 'arc', 'sweep',
+        'center', 'theta', 'delta', 'radius_scale'
+    )
+
+    def __init__(self, start, radius, rotation, arc, sweep, end):
+        super().__init__(start, end)
+        self.radius = radius
+        self.rotation = rotation
+        self.arc = bool(arc)
+        self.sweep = bool(sweep)
+        self.center = None
+        self.theta = 0
+        self.delta = 0
+        self.radius_scale = 1
+        self._parameterize()
+
+    def __repr__(self):
+        return (
+            f"Arc(start={self.start}, radius={self.radius}, "
+            f"rotation={self.rotation}, arc={self.arc}, sweep={self.sweep}, "
+            f"end={self.end})"
+        )
+
+    def _parameterize(self):
+        # http://www.w3.org/TR/SVG/implnote.html#ArcImplementationNotes
+        if self.start == self.end:
+            return
+
+        if self.radius.real == 0 or self.radius.imag == 0:
+            return
+
+        cosr = cos(radians(self.rotation))
+        sinr = sin(radians(self.rotation))
+        dx = (self.start.real - self.end.real) / 2
+        dy = (self.start.imag - self.end.imag) / 2
+        x1prim = cosr * dx + sinr * dy
+        x1prim_sq = x1prim * x1prim
+        y1prim = -sinr * dx + cosr * dy
+        y1prim_sq = y1prim * y1prim
+
+        rx = self.radius.real
+        rx_sq = rx * rx
+        ry = self.radius.imag
+        ry_sq = ry * ry
+
+        # correct out of range radii, only scale up.
+        radius_scale = (x1prim_sq / rx_sq) + (y1prim_sq / ry_sq)
+        if radius_scale > 1:
+            radius_scale = sqrt(radius_scale)
+            rx *= radius_scale
+            ry *= radius_scale
+            rx_sq = rx * rx
+            ry_sq = ry * ry
+            self.radius_scale = radius_scale
+
+        t1 = rx_sq * y1prim_sq
+        t2 = ry_sq * x1prim_sq
+        c = sqrt(abs((rx_sq * ry_sq - t1 - t2) / (t1 + t2)))
+
+        if self.arc == self.sweep:
+            c = -c
+        cxprim = c * rx * y1prim / ry
+        cyprim = -c * ry * x1prim / rx
+
+        self.center = complex(
+            (cosr * cxprim - sinr * cyprim) + ((self.start.real + self.end.real) / 2),
+            (sinr * cxprim + cosr * cyprim) + ((self.start.imag + self.end.imag) / 2),
+        )
+
+        ux = (x1prim - cxprim) / rx
+        uy = (y1prim - cyprim) / ry
+        vx = (-x1prim - cxprim) / rx
+        vy = (-y1prim - cyprim) / ry
+        n = sqrt(ux * ux + uy * uy)
+        theta = degrees(acos(ux / n))
+        if uy < 0:
+            theta = -theta
+        self.theta = theta % 360
+
+        n = sqrt((ux * ux + uy * uy) * (vx * vx + vy * vy))
+        d = (ux * vx + uy * vy) / n
+        d = min(1.0, max(-1.0, d))
+        delta = degrees(acos(d))
+        if (ux * vy - uy * vx) < 0:
+            delta = -delta
+        self.delta = delta % 360
+        if not self.sweep:
+            self.delta -= 360
+
+    def length(self):
+        if self.start == self.end:
+            return 0
+
+        if self.center is None:
+            distance = self.end - self.start
+            return sqrt(distance.real ** 2 + distance.imag ** 2)
+
+        if self.radius.real == self.radius.imag:
+            # circle arc, exact.
+            radius = self.radius.real * self.radius_scale
+            return radius * radians(abs(self.delta))
+
+        return svg_path.Arc(
+            self.start, self.radius, self.rotation,
+            self.arc, self.sweep, self.end
+        ).length()
+
+
+def _tokenize(pathdef):
+    """
+    Split the path into [(command, [values]), ...].
+    """
+    parts = COMMAND_RE.split(pathdef)
+    if parts[0].strip():
+        raise UnsupportedPath(pathdef)
+
+    tokens = []
+    for i in range(1, len(parts), 2):
+        chunk = parts[i + 1]
+        values = NUMBER_RE.findall(chunk)
+        # anything else than numbers and separators, not for us.
+        if sum(map(len, values)) != len(chunk.translate(SEPARATORS)):
+            raise UnsupportedPath(pathdef)
+        tokens.append((parts[i], [float(x) for x in values]))
+
+    return tokens
+
+
+def _parse(pathdef):
+    segments = []
+    start_pos = None
+    current_pos = 0j
+
+    for command, values in _tokenize(pathdef):
+        relative = command.islower()
+        command = command.upper()
+        count = ARGUMENT_COUNT[command]
+
+        if command == "Z":
+            if start_pos is None or values:
+                raise UnsupportedPath(pathdef)
+            segments.append(Close(current_pos, start_pos))
+            current_pos = start_pos
+            continue
+
+        # implicit repeated arguments.
+        if not values or len(values) % count:
+            raise UnsupportedPath(pathdef)
+
+        for i in range(0, len(values), count):
+            args = values[i:i + count]
+
+            if command == "M":
+                pos = complex(args[0], args[1])
+                if relative:
+                    pos += current_pos
+                if i == 0:
+                    segments.append(Move(pos))
+                    start_pos = pos
+                else:
+                    # implicit moveto arguments are lineto.
+                    segments.append(Line(current_pos, pos))
+                current_pos = pos
+            elif command == "L":
+                pos = complex(args[0], args[1])
+                if relative:
+                    pos += current_pos
+                segments.append(Line(current_pos, pos))
+                current_pos = pos
+            elif command == "H":
+                x = args[0] + current_pos.real if relative else args[0]
+                pos = complex(x, current_pos.imag)
+                segments.append(Line(current_pos, pos))
+                current_pos = pos
+            elif command == "V":
+                y = args[0] + current_pos.imag if relative else args[0]
+                pos = complex(current_pos.real, y)
+                segments.append(Line(current_pos, pos))
+                current_pos = pos
+            elif command == "C":
+                control1 = complex(args[0], args[1])
+                control2 = complex(args[2], args[3])
+                end = complex(args[4], args[5])
+                if relative:
+                    control1 += current_pos
+                    control2 += current_pos
+                    end += current_pos
+                segments.append(
+                    CubicBezier(current_pos, control1, control2, end)
+                )
+                current_pos = end
+            elif command == "A":
+                rx, ry, rotation, arc, sweep = args[:5]
+                if rx < 0 or ry < 0 or arc not in (0, 1) or sweep not in (0, 1):
+                    raise UnsupportedPath(pathdef)
+                end = complex(args[5], args[6])
+                if relative:
+                    end += current_pos
+                segments.append(
+                    Arc(current_pos, complex(rx, ry), rotation, arc, sweep, end)
+                )
+                current_pos = end
+
+    return tuple(segments)
+
+
+def _from_svg_path(segment):
+    # svg.path segment -> ours, unknown types are kept as is.
+    if isinstance(segment, svg_path.Move):
+        return Move(segment.start)
+    if isinstance(segment, svg_path.Close):
+        return Close(segment.start, segment.end)
+    if isinstance(segment, svg_path.Line):
+        return Line(segment.start, segment.end)
+    if isinstance(segment, svg_path.CubicBezier):
+        return CubicBezier(
+            segment.start, segment.control1, segment.control2, segment.end
+        )
+    if isinstance(segment, svg_path.Arc):
+        return Arc(
+            segment.start, segment.radius, segment.rotation,
+            segment.arc, segment.sweep, segment.end
+        )
+
+    return segment
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_path(pathdef):
+    """
+    Parse a SVG path, returns a tuple of segments.
+
+    Results are cached, the same path string shows up many times in a
+    symbol (pins), segments must not be modified.
+    """
+    try:
+        return _parse(pathdef)
+    except UnsupportedPath:
+        logger.debug("SVGPath: fallback to svg.path for %s", pathdef)
+
+    return tuple(_from_svg_path(x) for x in svg_parse_path(pathdef))
+
+
+def clear_cache():
+    parse_path.cache_clear()
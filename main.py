@@ -2,7 +2,6 @@ import wx
 import wx.svg
 import wx.lib.agw.hyperlink as hl
 
-import requests
 import webbrowser
 # import threading
 import io
@@ -11,6 +10,7 @@ import time
 import logging
 
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from logging import Handler, Formatter
 from cairosvg.parser import Tree as svgTree
@@ -18,6 +18,11 @@ from cairosvg.surface import SVGSurface, PNGSurface
 
 from gui_lib_manager import LibManagerControl
 from gui_adv_search import AdvSearchControl
+from helper.preview import render_png, PREVIEW_SIZE
+from helper.preview import get_preview_cache, get_render_executor
+from helper.preview import RENDERER_EASYEDA
+from helper.preview import symbol_preview, footprint_preview
+from helper.component import LCComponent, PartSession
 
 
 logger = logging.getLogger(__name__)
@@ -80,7 +85,8 @@ class WxHandler(Handler):
 
     def emit(self, record):
         msg = self.format(record)
-        self.status_write_func(msg)
+        # records may come from the lookup workers.
+        wx.CallAfter(self.status_write_func, msg)
 
 
 def load_asset(path):
@@ -158,29 +164,22 @@ class SVGMixin:
         self.svg = data
         self.bbox = bbox
 
-    def get_bitmap(self, scale=1):
-        bscale = min(600 / self.bbox['width'], 600 / self.bbox['height'])
-        png_scale = 1 if bscale < 0 else bscale
-
-        png = svgpng_conv(self.svg.encode(), png_scale)
-        # png.seek(0)
-
-        # wx_png = wx.Bitmap(wx.Image(png))
-        img = wx.Image(png)
-        h = img.GetWidth()
-        w = img.GetHeight()
-        i_size = 240
-        if w > h:
-            new_w = int(i_size)
-            new_h = int(i_size * h / w)
-        else:
-            new_h = int(i_size)
-            new_w = int(i_size * w / h)
+    def get_image(self, size=PREVIEW_SIZE):
+        # wx.Image only, safe to call from a worker thread.
+        # rendered at the display size, cached by uuid / updateTime / size,
+        # apart from the locally drawn previews.
+        png = get_preview_cache().get_or_render(
+            RENDERER_EASYEDA,
+            getattr(self, 'uuid', None),
+            getattr(self, 'update_time', None),
+            size,
+            lambda: render_png(self.svg, self.bbox, size)
+        )
 
-        img = img.Scale(new_h, new_w, wx.IMAGE_QUALITY_HIGH)
-        wx_png = wx.Bitmap(img)
+        return wx.Image(io.BytesIO(png))
 
-        return wx_png
+    def get_bitmap(self, size=PREVIEW_SIZE):
+        return wx.Bitmap(self.get_image(size))
 
 
 class EDAData:
@@ -201,11 +200,16 @@ class EDAFootprint(EDAData, SVGMixin):
 
 class LCPART:
 
-    def __init__(self, lcid):
+    def __init__(self, lcid, session=None):
         self.lcid = lcid.upper()
+        # every payload of the part is fetched once, through the session.
+        self.session = session or PartSession(self.lcid)
         self.svg_loaded = False
         self.footprint = None
         self.symbol = None
+        # symbol / footprint shapes, the previews are drawn from them.
+        self.component = None
+        self.component_loaded = False
 
         self.part_detail = {}
         self.part_loaded = False
@@ -242,11 +246,11 @@ class LCPART:
 
         url = img_urls[0]
 
-        req = requests.get(url)
-        if req.status_code != 200:
+        content = self.session.product_image(url)
+        if content is None:
             return None
 
-        img = wx.Image(io.BytesIO(req.content))
+        img = wx.Image(io.BytesIO(content))
         img = img_resize(img, 200, 200)
 
         return img
@@ -254,8 +258,7 @@ class LCPART:
     def get_part_detail_from_easyeda(self):
         logger.info("Fetching Part Info.")
         # req = requests.get(f'https://wwwapi.lcsc.com/v1/products/detail?product_code={self.lcid}')
-        req = requests.get(f'https://wmsc.lcsc.com/wmsc/product/detail?productCode={self.lcid}')
-        data = req.json()
+        data = self.session.product_detail()
 
         if isinstance(data, dict):
             self.part_detail = data['result']
@@ -265,11 +268,7 @@ class LCPART:
     def get_svg_from_easyeda(self):
         self.svg_loaded = True
         logger.info("Fetching Part Symbal & Footprint.")
-        req = requests.get(
-            f'https://easyeda.com/api/products/{self.lcid}/svgs'
-        )
-
-        data = req.json()
+        data = self.session.svgs()
 
         if data['code'] != 0:
             # warn_dialog(
@@ -296,6 +295,15 @@ class LCPART:
                     f"unknow doc type: {component['docType']}, {component}"
                 )
 
+    def load_component(self):
+        if not self.component_loaded:
+            self.component_loaded = True
+            component = LCComponent(self.lcid, session=self.session)
+            if component.load_componnt():
+                self.component = component
+
+        return self.component
+
     def get_footprint_img(self, **kwargs):
         if not self.svg_loaded:
             self.get_svg_from_easyeda()
@@ -314,6 +322,55 @@ class LCPART:
 
         return self.symbol.get_bitmap(**kwargs)
 
+    def get_preview_images(self, **kwargs):
+        """
+        Both previews as wx.Image (None if not avaliable). Runs on a worker
+        thread, bitmaps are made by the caller.
+
+        Drawn locally from the component data, the converted symbol and
+        footprint. The EasyEDA svgs are only fetched for the previews that
+        cannot be drawn (component not loaded or conversion failed).
+        """
+        # both previews are rendered at once on the render pool.
+        executor = get_render_executor()
+        images = [None, None]
+        failed = [True, True]
+
+        component = self.load_component()
+        if component is not None:
+            futures = [
+                executor.submit(symbol_preview, component, **kwargs),
+                executor.submit(footprint_preview, component, **kwargs)
+            ]
+            for i, future in enumerate(futures):
+                try:
+                    png = future.result()
+                except Exception:
+                    logger.exception("Unable to draw %s preview.", self.lcid)
+                    continue
+
+                failed[i] = False
+                if png is not None:
+                    images[i] = wx.Image(io.BytesIO(png))
+
+        if not any(failed):
+            return tuple(images)
+
+        # EasyEDA svgs for the previews that could not be drawn.
+        if not self.svg_loaded:
+            self.get_svg_from_easyeda()
+
+        futures = [
+            executor.submit(x.get_image, **kwargs)
+            if fail and x is not None else None
+            for fail, x in zip(failed, (self.symbol, self.footprint))
+        ]
+        for i, future in enumerate(futures):
+            if future is not None:
+                images[i] = future.result()
+
+        return tuple(images)
+
 
 class Main(wx.Frame):
     def __init__(self, *args, **kwds):
@@ -539,6 +596,9 @@ class Main(wx.Frame):
         self.lcpart = None
         self.lib_manager = None
         self.advsearch_manager = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="lcpart"
+        )
 
         self.log_init()
         self.status.WriteText("Init Done.\nVersion: Alpha.\n")
@@ -658,26 +718,86 @@ class Main(wx.Frame):
 
         logger.info(f"Get LCPart: {lcid}")
 
-        self.lcpart = LCPART(lcid)
-        self.img_EDASymbol.SetBitmap(
-            self.lcpart.get_symbol_img()
-        )
-        self.img_EDAFootprint.SetBitmap(
-            self.lcpart.get_footprint_img()
+        lcpart = LCPART(lcid)
+        self.lcpart = lcpart
+        self.reset_part_panels()
+
+        # previews and product detail are independent, fetch them
+        # concurrently. each panel is filled by wx.CallAfter as soon as its
+        # data arrives.
+        self.executor.submit(self.fetch_part_previews, lcpart)
+        self.executor.submit(self.fetch_part_detail, lcpart)
+        lcpart.session.prefetch(self.executor)
+
+    def reset_part_panels(self):
+        self.img_EDASymbol.SetBitmap(DrawFilledBitmap(250, 250))
+        self.img_EDAFootprint.SetBitmap(DrawFilledBitmap(250, 250))
+        self.prodcut_picture.SetBitmap(
+            DrawFilledBitmap(200, 200, label="Part Image\nNot Avaliable")
         )
+        self.part_name.SetLabelText("")
+        for attr in PART_INFO_CONF.values():
+            self.part_attrs[attr['name']].SetValue("")
+
+        self.btn_ds.Disable()
+        self.btn_ref.Disable()
+
+    def fetch_part_previews(self, lcpart):
+        try:
+            images = lcpart.get_preview_images()
+        except Exception:
+            logger.exception("Unable to load Symbol & Footprint preview.")
+            return
+
+        wx.CallAfter(self.show_part_previews, lcpart, *images)
+
+    def fetch_part_detail(self, lcpart):
+        try:
+            lcpart.get_part_detail_from_easyeda()
+        except Exception:
+            logger.exception("Unable to load Part Info.")
+            return
+
+        wx.CallAfter(self.show_part_detail, lcpart)
+
+        # image url comes with the detail.
+        try:
+            product_img = lcpart.get_part_img()
+        except Exception:
+            logger.exception("Unable to load Part Image.")
+            return
 
-        # product Info
-        product_img = self.lcpart.get_part_img()
         if product_img:
-            self.prodcut_picture.SetBitmap(
-                wx.Bitmap(product_img)
-            )
+            wx.CallAfter(self.show_part_img, lcpart, product_img)
+
+    def show_part_previews(self, lcpart, symbol_img, footprint_img):
+        # a newer search was started, drop the result.
+        if lcpart is not self.lcpart:
+            return
+
+        if symbol_img is None:
+            symbol_bmp = DrawFilledBitmap(250, 250, label="NOT AVALIABLE")
+        else:
+            symbol_bmp = wx.Bitmap(symbol_img)
+
+        if footprint_img is None:
+            footprint_bmp = DrawFilledBitmap(250, 250, label="NOT AVALIABLE")
+        else:
+            footprint_bmp = wx.Bitmap(footprint_img)
+
+        self.img_EDASymbol.SetBitmap(symbol_bmp)
+        self.img_EDAFootprint.SetBitmap(footprint_bmp)
+        logger.info("Symbol & Footprint Loaded.")
+
+    def show_part_detail(self, lcpart):
+        if lcpart is not self.lcpart:
+            return
 
         # product name
-        self.part_name.SetLabelText(self.lcpart.get_part_name())
+        self.part_name.SetLabelText(lcpart.get_part_name())
 
         # update part info
-        part_info = self.lcpart.get_part_info()
+        part_info = lcpart.get_part_info()
         for attr in PART_INFO_CONF.values():
             lc_value = part_info.get(attr['lc_key'], '-')
             self.part_attrs[attr['name']].SetValue(lc_value)
@@ -686,7 +806,13 @@ class Main(wx.Frame):
         self.btn_ds.Enable()
         self.btn_ref.Enable()
 
-        logger.info(f"Done.")
+        logger.info("Part Info Loaded.")
+
+    def show_part_img(self, lcpart, product_img):
+        if lcpart is not self.lcpart:
+            return
+
+        self.prodcut_picture.SetBitmap(wx.Bitmap(product_img))
 
     def btn_adv_search_pressed(self, e):
         if self.advsearch_manager is None:
@@ -708,7 +834,17 @@ class Main(wx.Frame):
         if self.lib_manager is None:
             self.lib_manager = LibManagerControl(self)
 
-        self.lib_manager.load_part(self.lcpart.lcid, self.lcpart.part_detail)    # type: ignore
+        # updateTime of the loaded component, validates the cached one.
+        update_time = None
+        if self.lcpart.component is not None:
+            update_time = self.lcpart.component.raw_data.get('updateTime')
+
+        self.lib_manager.load_part(
+            self.lcpart.lcid,
+            self.lcpart.part_detail or None,    # type: ignore
+            update_time=update_time,
+            session=self.lcpart.session
+        )
         # self.lib_manager.load_part("C9872")
 
 
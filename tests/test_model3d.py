@@ -0,0 +1,25 @@
+import io
+
+from helper.footprint.model3d import FaceWriter
+
+
+def parse_faces(*lines):
+    return FaceWriter(io.StringIO()).parse(" ".join(lines)).tolist()
+
+
+def test_face_vertex_only():
+    assert parse_faces("f 1 2 3", "f 4// 5// 6//") == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_face_vertex_normal():
+    assert parse_faces("f 1//1 2//2 3//3", "f 11//4 12//5 13//6") == [
+        [0, 1, 2],
+        [10, 11, 12],
+    ]
+
+
+def test_face_vertex_texture_normal():
+    assert parse_faces("f 1/1/1 2/2/2 3/3/3", "f 7/1 8/2 9/3") == [
+        [0, 1, 2],
+        [6, 7, 8],
+    ]